@@ -0,0 +1,50 @@
+"""Measures the time and memory it takes to import panairwrapper.
+
+Each import is done in a fresh interpreter, as it would be in a newly
+started sweep worker. The time of an interpreter that only imports numpy is
+reported alongside as the baseline.
+
+Usage
+-----
+python benchmarks/import_time.py [repeats]
+
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SCRIPT = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter()-start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, len(sys.modules))
+"""
+
+
+def measure(module, repeats=10):
+    """Returns the median import time, peak RSS and number of modules."""
+    results = []
+    for i in range(repeats):
+        output = subprocess.check_output(
+            [sys.executable, "-c", SCRIPT.format(module=module)], cwd=ROOT)
+        elapsed, rss, n_modules = output.split()
+        results.append((float(elapsed), int(rss), int(n_modules)))
+
+    results.sort()
+    return results[len(results)//2]
+
+
+def main(repeats=10):
+    for module in ["numpy", "panairwrapper"]:
+        elapsed, rss, n_modules = measure(module, repeats)
+        print("{0:<15} {1:8.1f} ms {2:8d} kB RSS {3:6d} modules".format(
+            module, 1000.*elapsed, rss, n_modules))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,206 @@
+"""Times the main code paths of panairwrapper across mesh sizes.
+
+Panair itself is replaced by the stub executable of the tests
+(test/stub_panair.py), which writes output files of realistic layout and
+size, so that only the time spent in panairwrapper is measured.
+
+The following are timed for each mesh size:
+- inputfile generation, from scratch and with unchanged networks
+- the OutputFiles parsers (off-body data, forces and moments, agps)
+- VTK export, if pyevtk is installed
+- the mesh_tools surface, parameter space, wake and coarsening functions
+- sweep throughput in cases per second
+
+Usage
+-----
+python benchmarks/run_benchmarks.py --output results.json
+python benchmarks/run_benchmarks.py --compare results.json
+
+With --compare, the timings are checked against a previously recorded
+file and the script exits with status 1 if any benchmark got slower by more
+than the given threshold.
+
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "test"))
+
+import panairwrapper
+import panairwrapper.filehandling as fh
+import panairwrapper.mesh_tools as mt
+import stub_panair
+
+
+# number of axial and circumferential points of the benchmark bodies
+MESH_SIZES = {"small": (100, 10), "medium": (1000, 30), "large": (5000, 60)}
+
+
+def timeit(func, repeats=3):
+    """Returns the best wall time of repeated calls of func in seconds."""
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter()-start)
+
+    return best
+
+
+def body_case(directory, exe, n_axial, n_theta, n_offbody=1000):
+    """Returns a case of a body of revolution with off-body points."""
+    data_x = np.linspace(0., 10., n_axial)
+    data_r = 0.5*np.sin(np.pi*data_x/10.)+1e-3
+    networks = mt.surface_of_revolution(data_x, data_r, n_theta)
+
+    case = panairwrapper.PanairWrapper("benchmark", directory, exe=exe)
+    case.set_aero_state(mach=1.6, alpha=2.)
+    for i, network in enumerate(networks):
+        case.add_network("body_"+str(i), network, xy_indexing=True)
+    offbody = np.zeros((n_offbody, 3))
+    offbody[:, 0] = np.linspace(0., 20., n_offbody)
+    offbody[:, 2] = -3.
+    case.add_offbody_points(offbody)
+
+    return case
+
+
+def bench_size(directory, exe, n_axial, n_theta, repeats):
+    results = {}
+    case = body_case(directory, exe, n_axial, n_theta)
+    case._generate_dir(True)
+
+    def generate():
+        case._render_cache.clear()
+        case._generate_inputfile()
+
+    results["inputfile"] = timeit(generate, repeats)
+    results["inputfile_unchanged"] = timeit(case._generate_inputfile,
+                                            repeats)
+
+    case.run()
+    output_file = fh.OutputFiles(case._directory)
+    results["parse_offbody"] = timeit(output_file.get_offbody_data, repeats)
+    results["parse_forces"] = timeit(output_file.get_forces_and_moments,
+                                     repeats)
+    results["parse_agps"] = timeit(output_file.read_agps, repeats)
+
+    # VTK export is only timed if pyevtk is installed
+    if importlib.util.find_spec("pyevtk") is not None:
+        vtk_dir = os.path.join(directory, "vtk")
+        os.makedirs(vtk_dir, exist_ok=True)
+        results["vtk"] = timeit(lambda: output_file.generate_vtk(
+            directory=vtk_dir), repeats)
+
+    data_x = np.linspace(0., 10., n_axial)
+    data_r = 0.5*np.sin(np.pi*data_x/10.)+1e-3
+    batch_x = np.tile(data_x, (100, 1))
+    batch_r = np.outer(np.linspace(0.5, 1.5, 100), data_r)
+    results["surface_of_revolution_batch"] = timeit(
+        lambda: mt.surface_of_revolution(batch_x, batch_r, n_theta), repeats)
+
+    eta_lower = np.zeros((100, n_axial, 2))
+    eta_lower[..., 0] = np.linspace(0., 1., n_axial)
+    eta_lower[..., 1] = np.linspace(0., .2, 100)[:, np.newaxis]
+    results["meshparameterspace_batch"] = timeit(
+        lambda: mt.meshparameterspace((n_axial, n_theta),
+                                      eta_limits=(eta_lower, None)), repeats)
+
+    te_points = [np.random.rand(n_theta, 3) for i in range(100)]
+    results["generate_wakes"] = timeit(
+        lambda: mt.generate_wakes(te_points, 2., n_points=20), repeats)
+
+    fine_x = np.linspace(0., 10., 20*n_axial)
+    fine_r = 0.5*np.sin(np.pi*fine_x/10.)+1e-3
+    results["coarsen_axi"] = timeit(
+        lambda: mt.coarsen_axi(fine_x, fine_r, 1e-4, 0.5), repeats)
+    # long straight segments, each spanning thousands of points
+    straight_r = np.full(len(fine_x), 0.5)
+    results["coarsen_axi_straight"] = timeit(
+        lambda: mt.coarsen_axi(fine_x, straight_r, 1e-2, 2.), repeats)
+
+    n_cases = 8
+    sweep_time = timeit(lambda: case.sweep(alpha=np.linspace(0., 7., n_cases),
+                                           workers=4), 1)
+    results["sweep_cases_per_second"] = n_cases/sweep_time
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the benchmarks that got slower than the baseline."""
+    regressions = []
+    for size, timings in results.items():
+        for name, value in timings.items():
+            old = baseline.get(size, {}).get(name)
+            if old is None:
+                continue
+            # throughputs get worse when they go down
+            if name.endswith("per_second"):
+                ratio = old/value
+            else:
+                ratio = value/old
+            if ratio > threshold:
+                regressions.append((size, name, ratio))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", nargs="+", default=list(MESH_SIZES),
+                        choices=list(MESH_SIZES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="json file to record results in")
+    parser.add_argument("--compare", help="json file of earlier results")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="slowdown factor reported as a regression")
+    args = parser.parse_args()
+
+    if platform.system() == 'Windows':
+        sys.exit("the stub Panair executable requires a POSIX shell")
+
+    directory = tempfile.mkdtemp(prefix="panair_benchmark_")
+    try:
+        exe = stub_panair.write_executable(directory)
+        results = {}
+        for size in args.sizes:
+            n_axial, n_theta = MESH_SIZES[size]
+            results[size] = bench_size(os.path.join(directory, size), exe,
+                                       n_axial, n_theta, args.repeats)
+            for name, value in results[size].items():
+                print("{0:<8} {1:<30} {2:12.6f}".format(size, name, value))
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output is not None:
+        record = {"python": platform.python_version(),
+                  "numpy": np.__version__,
+                  "machine": platform.machine(),
+                  "results": results}
+        with open(args.output, 'w') as f:
+            json.dump(record, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, ratio in regressions:
+            print("regression: {0} {1} is {2:.2f} times slower".format(
+                size, name, ratio))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
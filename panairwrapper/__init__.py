@@ -1,2 +1,11 @@
 from .panairwrapper import PanairWrapper
-import panairwrapper.mesh_tools
+
+
+def __getattr__(name):
+    # mesh_tools and plot are only imported when first used, so that
+    # importing panairwrapper stays cheap
+    if name in ("mesh_tools", "plot"):
+        import importlib
+        return importlib.import_module("."+name, __name__)
+
+    raise AttributeError("module "+__name__+" has no attribute "+name)
@@ -0,0 +1,201 @@
+"""This module provides an on-disk cache of Panair results.
+
+Results are stored under a key computed from the contents of the Panair
+inputfile and the identity of the Panair executable. Running a case whose
+inputfile matches a cached one can then return the results without calling
+Panair at all.
+
+Example
+-------
+import panairwrapper
+from panairwrapper.cache import ResultCache
+
+cache = ResultCache("./panair_cache", max_size=2**30)
+
+case = panairwrapper.PanairWrapper("wing")
+...
+results = case.run(cache=cache)
+
+Notes
+-----
+The parsed forces and moments, off-body data and agps data of each case
+are stored together in a single numpy .npz file per key. The total size of
+the cache is bounded by max_size, the least recently used entries being
+removed first.
+
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+import numpy as np
+import panairwrapper.filehandling as fh
+
+
+class ResultCache:
+    """Stores parsed Panair results keyed on the inputfile that produced them.
+
+    Parameters
+    ----------
+    directory : str
+        Folder the cache entries are kept in. It is created if it doesn't
+        exist.
+    max_size : int
+        Maximum total size of the cache entries in bytes.
+
+    """
+    def __init__(self, directory, max_size=2**30):
+        self._directory = directory
+        self._max_size = max_size
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(inputfile, exe):
+        """Returns the cache key of an inputfile run with the executable exe.
+
+        The executable is identified by its path, size and modification
+        time so that rebuilding Panair invalidates the cached results.
+
+        """
+        stat = os.stat(exe)
+        exe_id = "{0}:{1}:{2}".format(os.path.realpath(exe), stat.st_size,
+                                      stat.st_mtime_ns)
+
+        sha = hashlib.sha256(exe_id.encode())
+        with open(inputfile, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key+".npz")
+
+    def get(self, key):
+        """Returns a CachedOutputFiles for the key or None if not cached."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return CachedOutputFiles(arrays)
+
+    def put(self, key, output_file, n_cases=1, offbody=True):
+        """Parses the results of a finished run and stores them under key.
+
+        Parameters
+        ----------
+        key : str
+            Key as returned by ResultCache.key.
+        output_file : OutputFiles
+            Output files of the run.
+        n_cases : int
+            Number of cases in the run.
+        offbody : bool
+            Whether the run includes off-body points.
+
+        """
+        arrays = parse_results(output_file, n_cases, offbody)
+
+        # write to a temporary file first so that readers never see a
+        # partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            # don't leave the partial entry behind, e.g. on a full disk
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        # removes least recently used entries until the cache fits max_size
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
+
+
+def parse_results(output_file, n_cases=1, offbody=True):
+    """Parses the results of a finished run into a dict of numpy arrays.
+
+    The arrays are those stored in a cache entry and can be turned back
+    into an OutputFiles with CachedOutputFiles. See ResultCache.put for the
+    description of the parameters.
+
+    """
+    arrays = {}
+    for case in range(n_cases):
+        ffmf = output_file.get_forces_and_moments(case)
+        arrays["forces_"+str(case)] = np.array(
+            [ffmf[k] for k in fh.FORCES_AND_MOMENTS])
+        if offbody:
+            offbody_data = output_file.get_offbody_data(case)
+            arrays["offbody_"+str(case)] = offbody_data
+        try:
+            arrays["agps_"+str(case)] = output_file.read_agps(case)
+        except (OSError, IndexError, ValueError):
+            pass
+
+    return arrays
+
+
+class CachedOutputFiles(fh.OutputFiles):
+    """Provides the OutputFiles data access for results held in the cache."""
+
+    def __init__(self, arrays):
+        super().__init__(None)
+        self._arrays = arrays
+
+    def _get(self, name, case):
+        try:
+            return self._arrays[name+"_"+str(case)]
+        except KeyError:
+            raise RuntimeError(name+" data of case "+str(case)+" not cached")
+
+    def get_offbody_data(self, case=0):
+        return self._get("offbody", case)
+
+    def get_forces_and_moments(self, case=0):
+        values = self._get("forces", case)
+
+        return dict(zip(fh.FORCES_AND_MOMENTS, values.tolist()))
+
+    def check_successful(self):
+        return True
+
+    def read_agps(self, case=0):
+        return self._get("agps", case)
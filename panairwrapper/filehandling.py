@@ -18,11 +18,68 @@ http://www.pdas.com/panairrefs.html
 """
 from collections import OrderedDict
 import numpy as np
-from math import copysign
 from os.path import join
+import hashlib
+import mmap
+import os
 import re
 
 
+# layout of the point data found in the agps file
+AGPS_DTYPE = np.dtype([('network', int), ('column', int), ('row', int),
+                       ('x', float), ('y', float), ('z', float),
+                       ('cp', float)])
+
+# keys of the dictionary returned by OutputFiles.get_forces_and_moments
+FORCES_AND_MOMENTS = ['cl', 'cdi', 'cy', 'fx', 'fy', 'fz',
+                      'mx', 'my', 'mz', 'area']
+
+
+def _array_digest(array):
+    # hash of the shape and values of an array
+    array = np.ascontiguousarray(array, dtype=float)
+    sha = hashlib.sha1(str(array.shape).encode())
+    sha.update(array.data)
+
+    return sha.hexdigest()
+
+
+class _CachedPart:
+    # parts of a block whose text may be copied from the previous inputfile,
+    # identified by key and the hash of the coordinates they hold
+    def __init__(self, key, digest, parts):
+        self.key = key
+        self.digest = digest
+        self.parts = parts
+
+
+def _encode(text):
+    # inputfiles are written with the line endings of the platform
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode()
+
+
+def _file_stamp(filename):
+    # identifies the contents of a file as long as it isn't modified
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _copy_range(source, target, start, end, chunk=2**20):
+    # copies bytes start to end of the source file to the target file
+    source.seek(start)
+    while start < end:
+        data = source.read(min(chunk, end-start))
+        if not data:
+            raise RuntimeError("inputfile ended unexpectedly")
+        target.write(data)
+        start += len(data)
+
+
 class InputFile:
     """Handles the formatting of a Panair input file.
 
@@ -31,6 +88,24 @@ class InputFile:
     required data has been specified in this manner, the inputfile may be
     generated using the write_inputfile member function.
 
+    Parameters
+    ----------
+    streaming : bool
+        If True, coordinate arrays are kept as references and only formatted
+        when write_inputfile is called, in chunks written directly to the
+        file. This keeps the memory use of large geometries bounded by the
+        chunk size rather than by the size of the inputfile text.
+    chunk_size : int
+        Approximate number of points formatted at a time in streaming mode.
+    cache : dict, optional
+        If given, write_inputfile records in this dict where the text of
+        each network and of the off-body points was written in the file,
+        together with a hash of the coordinates. Writing the same file from
+        a new InputFile with the same dict copies the text of every array
+        that hasn't changed from the previous file instead of formatting it
+        again. The previous file is only used if it hasn't been modified
+        since it was written.
+
     Example
     -------
     The following is code for generating an inputfile for a simple Panair case.
@@ -77,15 +152,105 @@ class InputFile:
     out the appropriate formatting, and then follow the patterns used for
     the other input blocks this class to implement the new one.
     """
-    def __init__(self):
+    def __init__(self, streaming=False, chunk_size=16384, cache=None):
         self._input_dict = OrderedDict()
+        self._streaming = streaming
+        self._chunk_size = chunk_size
+        self._cache = cache
 
     def write_inputfile(self, filename):
-        with open(filename, 'w') as f:
-            for name, text in self._input_dict.items():
-                f.write("$"+name+"\n")
-                f.write(text)
-            f.write("$end")
+        # the new file is written next to the previous one, from which the
+        # text of unchanged arrays is copied, and replaces it once complete
+        previous = self._previous_inputfile(filename)
+        offsets = {}
+        try:
+            with open(filename+".tmp", 'wb', buffering=2**20) as f:
+                for name, block in self._input_dict.items():
+                    f.write(_encode("$"+name+"\n"))
+                    if isinstance(block, str):
+                        block = [block]
+                    for part in block:
+                        if isinstance(part, _CachedPart):
+                            offsets[part.key] = self._write_cached(
+                                f, part, previous)
+                        else:
+                            for text in self._render([part],
+                                                     self._chunk_size):
+                                f.write(_encode(text))
+                f.write(_encode("$end"))
+        except BaseException:
+            if os.path.exists(filename+".tmp"):
+                os.remove(filename+".tmp")
+            raise
+        finally:
+            if previous is not None:
+                previous.close()
+        os.replace(filename+".tmp", filename)
+
+        if self._cache is not None:
+            # entries of arrays no longer in the inputfile are dropped
+            self._cache.clear()
+            self._cache.update(offsets)
+            self._cache[("inputfile",)] = (os.path.abspath(filename),
+                                           _file_stamp(filename))
+
+    def _write_cached(self, f, part, previous):
+        # writes the text of part, copied from the previous inputfile if its
+        # points are unchanged, and returns its cache entry
+        start = f.tell()
+        entry = self._cache.get(part.key)
+        if (previous is not None and entry is not None and
+                entry[0] == part.digest):
+            _copy_range(previous, f, entry[1], entry[2])
+        else:
+            for text in self._render(part.parts, self._chunk_size):
+                f.write(_encode(text))
+
+        return (part.digest, start, f.tell())
+
+    def _previous_inputfile(self, filename):
+        # opens the file last written with the cache, unless it has been
+        # modified or replaced since
+        if self._cache is None:
+            return None
+        written = self._cache.get(("inputfile",))
+        if written != (os.path.abspath(filename), _file_stamp(filename)):
+            return None
+
+        return open(filename, 'rb')
+
+    def _cached_parts(self, key, points, parts):
+        # marks the parts of a block whose text can be copied from the
+        # previous inputfile if the points haven't changed
+        if self._cache is None:
+            return parts
+
+        return [_CachedPart(key, _array_digest(points), parts)]
+
+    def _set_block(self, name, parts):
+        # Blocks holding coordinate arrays are given as a list of text and
+        # arrays. In streaming mode this list is stored as is and only
+        # rendered, chunk by chunk, when the inputfile is written.
+        if self._streaming:
+            self._input_dict[name] = parts
+        else:
+            self._input_dict[name] = "".join(self._render(parts))
+
+    def _render(self, parts, chunk_size=None):
+        # yields the text of a block, formatting arrays at most chunk_size
+        # points at a time
+        for part in parts:
+            if isinstance(part, str):
+                yield part
+            elif isinstance(part, _CachedPart):
+                yield from self._render(part.parts, chunk_size)
+            elif chunk_size is None:
+                yield self._format_coords(part)
+            else:
+                nn, nm = part.shape[:2]
+                rows = max(1, chunk_size//max(1, nm))
+                for i in range(0, nn, rows):
+                    yield self._format_coords(part[i:i+rows])
 
     @staticmethod
     def _format_opt(number):
@@ -96,33 +261,39 @@ class InputFile:
     def _format_str_opt(string):
         return '{0:<10}'.format(string)
 
-    def _format_coord(self, coordinates):
-        precision = [6, 6, 6]
-        for i, c in enumerate(coordinates):
-            precision[i] = self._fixed_width_precision(c)
+    def _format_coords(self, points):
+        # formats an (nn, nm, 3) array of coordinates in a single pass. Each
+        # of the nn rows is written two points per line with a trailing
+        # newline after the last point of the row.
+        points = np.asarray(points, dtype=float)
+        nn, nm = points.shape[:2]
+        precision = self._fixed_width_precision(points)
+
+        # interleave precision and value for the '*' precision specifier
+        args = [None]*(2*points.size)
+        args[0::2] = precision.ravel().tolist()
+        args[1::2] = points.ravel().tolist()
 
-        s = ('{0[0]:<10.'+str(precision[0])+'f}' +
-             '{0[1]:<10.'+str(precision[1])+'f}' +
-             '{0[2]:<10.'+str(precision[2])+'f}')
+        coord = "%-10.*f%-10.*f%-10.*f"
+        row = (2*coord+"\n")*(nm//2)
+        if nm % 2 != 0:
+            row += coord+"\n"
 
-        return s.format(coordinates)
+        return (row*nn) % tuple(args)
 
     @staticmethod
-    def _fixed_width_precision(number):
-        precision = 8
-        if copysign(1, number) < 0:
-            precision -= 1
-        if abs(number) >= 10:
-            precision -= 1
-        if abs(number) >= 100:
-            precision -= 1
-        if abs(number) >= 1000:
-            precision -= 1
-        if abs(number) >= 10000:
-            precision -= 1
-        if abs(number) >= 100000:
+    def _fixed_width_precision(numbers):
+        # number of decimals that keeps each number 10 characters wide
+        numbers = np.asarray(numbers, dtype=float)
+        magnitude = np.abs(numbers)
+        if np.any(magnitude >= 100000):
             raise RuntimeError("formatting not implemented")
 
+        precision = np.full(numbers.shape, 8, dtype=int)
+        precision -= np.signbit(numbers)
+        for limit in (10, 100, 1000, 10000):
+            precision -= magnitude >= limit
+
         return precision
 
     def _format_header(self, labels):
@@ -172,13 +343,8 @@ class InputFile:
         header1 = self._format_header(["alpc"])
         input1 = self._format_inputline([alpc])
         # generate headers for alphas based on number
-        headers_2 = []
-        for i, a in enumerate(alphas):
-            headers_2.append("alpha("+str(i)+")")
-        header2 = self._format_header(headers_2)
-        input2 = self._format_inputline(alphas)
-
-        aoa_input = header1+input1+header2+input2
+        headers_2 = ["alpha("+str(i)+")" for i in range(len(alphas))]
+        aoa_input = header1+input1+self._format_cards(headers_2, alphas)
 
         self._input_dict["ANGLES OF ATTACK"] = aoa_input
 
@@ -186,16 +352,21 @@ class InputFile:
         header1 = self._format_header(["betc"])
         input1 = self._format_inputline([betc])
         # generate headers for betas based on number
-        headers_2 = []
-        for i, b in enumerate(betas):
-            headers_2.append("beta("+str(i)+")")
-        header2 = self._format_header(headers_2)
-        input2 = self._format_inputline(betas)
-
-        beta_input = header1+input1+header2+input2
+        headers_2 = ["beta("+str(i)+")" for i in range(len(betas))]
+        beta_input = header1+input1+self._format_cards(headers_2, betas)
 
         self._input_dict["YAW ANGLE"] = beta_input
 
+    def _format_cards(self, labels, values, per_card=6):
+        # splits values over as many cards of per_card fields as needed,
+        # each preceded by its header, as done for PRINTOUT CONTROL
+        cards = ""
+        for i in range(0, len(values), per_card):
+            cards += self._format_header(labels[i:i+per_card])
+            cards += self._format_inputline(values[i:i+per_card])
+
+        return cards
+
     def referencedata(self, xref, yref, zref, sref, bref, cref, dref):
         header1 = self._format_header(["xref", "yref", "zref"])
         input1 = self._format_inputline([xref, yref, zref])
@@ -226,29 +397,22 @@ class InputFile:
         input1 = self._format_inputline([kn])
         header2 = self._format_header(["kt"])
         input2 = self._format_inputline([kt])
-        points_input = header1+input1+header2+input2
+        points_input = [header1+input1+header2+input2]
         for i in range(int(kn)):
-            points_input += self._gen_network_inp(netnames[i], netpoints[i])
+            network_input = self._gen_network_inp(netnames[i], netpoints[i])
+            points_input.extend(self._cached_parts(("network", netnames[i]),
+                                                   netpoints[i],
+                                                   network_input))
 
-        self._input_dict["POINTS kt="+str(kt)] = points_input
+        self._set_block("POINTS kt="+str(kt), points_input)
 
     def _gen_network_inp(self, netname, points):
         header = ("=nm       nn                                             " +
                   "    " + netname + "\n")
         nn, nm = points.shape[:2]
         values = self._format_inputline([nm, nn])
-        network_input = header+values
-        for i in range(int(nn)):
-            for j in range(int(nm)):
-                network_input += self._format_coord(points[i, j])
-
-                if (j+1) % 2 is 0:
-                    network_input += "\n"
-
-            if nm % 2 is not 0:
-                network_input += "\n"
 
-        return network_input
+        return [header+values, points]
 
     def trailingwakenetworks(self, kn, kt, matchw, netnames, inat,
                              insd, xwake, twake):
@@ -256,12 +420,17 @@ class InputFile:
         input1 = self._format_inputline([kn])
         header2 = self._format_header(["kt", "matchw"])
         input2 = self._format_inputline([kt, matchw])
-        wake_input = header1+input1+header2+input2
+        wake_input = [header1+input1+header2+input2]
         for i in range(int(kn)):
-            wake_input += self._gen_wake_inp(netnames[i], inat[i], insd[i],
-                                             xwake[i], twake[i])
+            wake_input.append(self._gen_wake_inp(netnames[i], inat[i],
+                                                 insd[i], xwake[i], twake[i]))
 
-        self._input_dict["TRAILING matchw="+str(matchw)] = wake_input
+        # other wake types get their type in the title so that groups of
+        # different types don't replace each other
+        name = "TRAILING matchw="+str(matchw)
+        if int(kt) != 18:
+            name = "TRAILING kt="+str(kt)+" matchw="+str(matchw)
+        self._set_block(name, ["".join(wake_input)])
 
     def _gen_wake_inp(self, netname, inat, insd, xwake, twake):
         header = ("=inat     insd      xwake     twake                      " +
@@ -282,15 +451,17 @@ class InputFile:
         input1 = self._format_inputline([isk1])
         header2 = self._format_header(["xof", "yof", "zof",
                                        "xof", "yof", "zof"])
-        offbody_input = header1+input1+header2
-        for i in range(int(isk1)):
-            offbody_input += self._format_coord(points[i])
-            if (i+1) % 2 is 0:
-                offbody_input += "\n"
-        if int(isk1) % 2 is not 0:
-            offbody_input += "\n"
+        # off-body points are written two per line, which is the same as
+        # formatting rows of two points followed by a final odd point
+        points = np.asarray(points)[:int(isk1)]
+        n_pairs = len(points)//2
+        offbody_input = self._cached_parts(
+            ("offbody",), points,
+            [points[:2*n_pairs].reshape(n_pairs, 2, 3),
+             points[2*n_pairs:].reshape(1, -1, 3)])
+        offbody_input.insert(0, header1+input1+header2)
 
-        self._input_dict["XYZ OF OFF-BODY POINTS"] = offbody_input
+        self._set_block("XYZ OF OFF-BODY POINTS", offbody_input)
 
 
 class OutputFiles:
@@ -301,22 +472,69 @@ class OutputFiles:
     """
     def __init__(self, directory):
         self._directory = directory
+        self._block_index = None
+        self._block_index_stamp = None
 
-    def _get_block(self, block_name):
+    def _get_block_index(self):
+        # returns the index of blocks in panair.out. The index is cached and
+        # only rebuilt if the modification time or size of the file changes.
+        filename = join(self._directory, "panair.out")
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if self._block_index is None or stamp != self._block_index_stamp:
+            self._block_index = self._index_blocks(filename)
+            self._block_index_stamp = stamp
+
+        return self._block_index
+
+    @staticmethod
+    def _index_blocks(filename):
+        # scans panair.out once and maps each block name to a list of
+        # (start, end) byte offsets of the lines inside the block, one entry
+        # for each time the block occurs in the file.
+        index = OrderedDict()
+        open_blocks = {}
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return index
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for match in re.finditer(rb'0\*([be])\*(\S+)', m):
+                    flag, name = match.group(1), match.group(2).decode()
+                    if flag == b'b':
+                        # block starts on the line after the begin flag
+                        start = m.find(b'\n', match.end())
+                        open_blocks[name] = len(m) if start < 0 else start+1
+                    elif name in open_blocks:
+                        # block ends at the start of the end flag line
+                        end = m.rfind(b'\n', 0, match.start())+1
+                        offsets = (open_blocks.pop(name), end)
+                        index.setdefault(name, []).append(offsets)
+
+        return index
+
+    def _block_offsets(self, block_name):
+        # byte offsets of each occurrence of a block in panair.out
+        index = self._get_block_index()
+        offsets = index.get(block_name)
+        if offsets is None:
+            # fall back to the first block whose name starts with block_name
+            for name, name_offsets in index.items():
+                if name.startswith(block_name):
+                    offsets = name_offsets
+                    break
+            else:
+                raise RuntimeError("block "+block_name+" not found")
+
+        return offsets
+
+    def _get_block(self, block_name, occurrence=0):
         # retrieves lines inside block
-        begin_flag = "0*b*"+block_name
-        end_flag = "0*e*"+block_name
-        with open(join(self._directory, "panair.out")) as f:
-            lines = f.readlines()
-            count = 0
-            while begin_flag not in lines[count]:
-                count += 1
-            front = count+1
-            while end_flag not in lines[count]:
-                count += 1
-            back = count
+        start, end = self._block_offsets(block_name)[occurrence]
+        with open(join(self._directory, "panair.out"), 'rb') as f:
+            f.seek(start)
+            text = f.read(end-start).decode('latin-1')
 
-            return lines[front:back]
+        return text.splitlines(True)
 
     @staticmethod
     def _lines_to_numpy(data_lines):
@@ -325,20 +543,46 @@ class OutputFiles:
 
         return np.array(array)
 
-    def get_offbody_data(self):
-        block_lines = self._get_block("off-body")
+    def get_offbody_data(self, case=0):
+        # each case of a multi-case run has its own off-body block, whose
+        # second column holds the solution number of the case. The layout
+        # is only checked for multi-case output, single-case output is read
+        # as is.
+        n_blocks = len(self._block_offsets("off-body"))
+        if case >= n_blocks:
+            raise RuntimeError("no off-body block for case {0}".format(case))
+        block_lines = self._get_block("off-body", occurrence=case)
         data_lines = block_lines[6:]
 
         data = self._lines_to_numpy(data_lines)
+        if n_blocks > 1 and len(data) > 0 and (
+                data.ndim != 2 or data.shape[1] < 2 or
+                np.any(data[:, 1] != case+1)):
+            raise RuntimeError("off-body block {0} doesn't hold the data of "
+                               "case {0}".format(case))
 
         return data
 
-    def get_forces_and_moments(self):
+    def get_forces_and_moments(self, case=0):
         with open(join(self._directory, "ffmf")) as f:
             lines = f.readlines()
 
-        data1 = list(map(float, lines[17].split()))
-        data2 = list(map(float, lines[18].split()))
+        if case == 0:
+            data1 = list(map(float, lines[17].split()))
+            data2 = list(map(float, lines[18].split()))
+        else:
+            # the totals of the other cases are given on pairs of lines
+            # following those of the first case. The first line of a pair
+            # starts with the solution number of its case.
+            data_lines = [line for line in lines[17:] if line.strip()]
+            try:
+                data1 = list(map(float, data_lines[2*case].split()))
+                data2 = list(map(float, data_lines[2*case+1].split()))
+            except (IndexError, ValueError):
+                data1 = data2 = []
+            if len(data1) != 9 or data1[0] != case+1 or len(data2) < 4:
+                raise RuntimeError("ffmf doesn't hold the forces and moments "
+                                   "of case {0}".format(case))
 
         ffmf = {'cl': data1[3],
                 'cdi': data1[4],
@@ -364,115 +608,203 @@ class OutputFiles:
 
         return success
 
-    def parse_agps(self):
+    def parse_agps(self, case=0):
         # parses data in agps file into list.
         # List contains network #, column #, row #, x, y, z, Cp
         # for each point.
+        return [list(point) for point in self.read_agps(case).tolist()]
+
+    def read_agps(self, case=0):
+        """Reads the agps file into a structured numpy array.
+
+        Parameters
+        ----------
+        case : int
+            Index of the case whose pressure coefficients are returned. The
+            agps file of a multi-case run has one Cp column per case.
+
+        Returns
+        -------
+        numpy structured array
+            One entry per point with the fields network, column, row, x, y,
+            z and cp (see AGPS_DTYPE).
+
+        """
         with open(join(self._directory, "agps")) as f:
             lines = f.readlines()
 
-        data = []
-        n = 0
-        c = 0
+        # single scan to separate the data lines from the network/column
+        # headers, recording how many data lines follow each header
+        data_lines = []
+        headers = []
+        counts = []
         for line in lines[6:]:
-            network = []
-            if re.match('n[0-9]*', line) is not None:
+            if line.startswith('n'):
                 network, column = line.split('c')
-                n = int(network[1:])
-                c = int(column)
-            elif re.match('\*eof', line) is not None:
-                pass
-            elif re.match(' irow', line) is not None:
+                headers.append((int(network[1:]), int(column)))
+                counts.append(0)
+            elif line.startswith('*eof') or line.startswith(' irow'):
                 pass
-            else:
-                row_data = line.split()
-                r = int(row_data[0])
-                xyzCp = list(map(float, row_data[1:]))
-                data.append([n, c, r]+xyzCp)
-
-        return data
-
-
-    def generate_vtk(self, filename='panair', data=None) :
+            elif line.strip():
+                data_lines.append(line)
+                counts[-1] += 1
+
+        agps = np.empty(len(data_lines), dtype=AGPS_DTYPE)
+        if not data_lines:
+            return agps
+
+        values = np.loadtxt(data_lines, ndmin=2)
+        headers = np.array(headers, dtype=int).reshape(-1, 2)
+        agps['network'] = np.repeat(headers[:, 0], counts)
+        agps['column'] = np.repeat(headers[:, 1], counts)
+        agps['row'] = values[:, 0]
+        agps['x'] = values[:, 1]
+        agps['y'] = values[:, 2]
+        agps['z'] = values[:, 3]
+        agps['cp'] = values[:, 4+case]
+
+        return agps
+
+    def get_agps_grids(self, data=None):
+        """Arranges the agps data of each network into grids.
+
+        Parameters
+        ----------
+        data : numpy structured array or list, optional
+            Data as returned by read_agps or parse_agps. If None, the agps
+            file is read.
+
+        Returns
+        -------
+        dict
+            Maps each network number to a dict holding the x, y, z and cp
+            values of the network, each as an array of shape (rows, cols).
+
+        """
+        if data is None:
+            data = self.read_agps()
+        elif np.asarray(data).dtype.names is None:
+            # convert rows of network, column, row, x, y, z, Cp
+            values = np.asarray(data, dtype=float).reshape(-1, 7)
+            data = np.empty(len(values), dtype=AGPS_DTYPE)
+            for i, name in enumerate(AGPS_DTYPE.names):
+                data[name] = values[:, i]
+
+        grids = OrderedDict()
+        for n in np.unique(data['network']):
+            points = data[data['network'] == n]
+            rows = points['row']-1
+            cols = points['column']-1
+            shape = (rows.max()+1, cols.max()+1)
+            grids[int(n)] = {}
+            for name in ['x', 'y', 'z', 'cp']:
+                grid = np.zeros(shape)
+                grid[rows, cols] = points[name]
+                grids[int(n)][name] = grid
+
+        return grids
+
+    def generate_vtk(self, filename='panair', data=None, directory='.',
+                     workers=None, case=0):
         '''
         Function to generate a set of vtk files from the output data.
-        
-        INPUTS : 
-        - 'filename' is a string to use in filenames. 
+
+        INPUTS :
+        - 'filename' is a string to use in filenames.
         It will be followed by 'network' and the # of that network.
-        For example 'panair_network_1'
-        When opening files in Paraview, it will suggest you to import all 
-        similar files as a group, but you should select them all as individual
-        files instead as groups are intended to be the same geometry through 
-        different timesteps.
+        For example 'panair_network1'
+        A multiblock file 'panair.vtm' referencing all of the network files
+        is also written. Opening this file in Paraview loads every network
+        at once.
         - 'data' is used if you want to send to use a different set of data than
         the one from the agps. If left to None, the function will get data from the
         agps.
-        
+        - 'directory' is the folder the files are written to.
+        - 'workers' is the number of threads used to write the network files.
+        - 'case' is the index of the case whose Cp is written when reading
+        the agps file.
+
         OUTPUT :
-        The function will produce one or several files, one for each network, 
-        in the folder it's run from.
+        The function will produce one file for each network plus the
+        multiblock file, and returns the path of the multiblock file.
         '''
-        import evtk.hl
         if data is None:
-            data = self.parse_agps()
-        
-        networks = int(max(np.array(data)[:,0]))
-        all_points = []
-        for i in range(networks) :
-            all_points.append([])
-        for p in data :
-            all_points[int(p[0]-1)].append(p)
-
-        for n in range(networks) :
-            points_array = np.array(all_points[n])
-            n_columns = int(max(points_array[:,1]))
-            n_rows = int(max(points_array[:,2]))
-            
-            X = np.zeros((n_rows, n_columns, 1))
-            Y = np.zeros((n_rows, n_columns, 1))
-            Z = np.zeros((n_rows, n_columns, 1))
-            CP = np.zeros((n_rows, n_columns, 1))
-
-            for p in points_array :
-                X[int(p[2]-1),int(p[1]-1), 0] = p[3]
-                Y[int(p[2]-1),int(p[1]-1), 0] = p[4]
-                Z[int(p[2]-1),int(p[1]-1), 0] = p[5]
-                CP[int(p[2]-1),int(p[1]-1), 0] = p[6]
-
-            evtk.hl.gridToVTK(filename+'_network'+str(n+1), 
-                              X, Y, Z, pointData = {"CP" : CP})
-        
-        
-def generate_vtk_input(data, filename='panair') :
+            data = self.read_agps(case)
+        grids = self.get_agps_grids(data)
+
+        networks = OrderedDict()
+        for n, grid in grids.items():
+            networks[n] = (grid['x'], grid['y'], grid['z'],
+                           {"CP": grid['cp']})
+
+        return _write_vtk_networks(networks, filename, directory, workers)
+
+
+def generate_vtk_input(data, filename='panair', directory='.', workers=None):
     '''
-    Function to generate vtk files from a panair input mesh 
+    Function to generate vtk files from a panair input mesh
     INPUT :
-    - data is a list of networks which are 3D arrays with the dimensions being 
+    - data is a list of networks which are 3D arrays with the dimensions being
     columns, rows, and coordinates)
-    - 'filename' is a string to use in filenames. 
-    For example 'panair' will result in files called 'panair_network_1', etc.
-    
-    OUTPUT : 
-    The function will produce one or several files, one for each network, 
-    in the folder it's run from.
+    - 'filename' is a string to use in filenames.
+    For example 'panair' will result in files called 'panair_network1', etc.
+    and a multiblock file 'panair.vtm'.
+    - 'directory' is the folder the files are written to.
+    - 'workers' is the number of threads used to write the network files.
+
+    OUTPUT :
+    The function will produce one file for each network plus the multiblock
+    file, and returns the path of the multiblock file.
     '''
-    import evtk.hl
-    networks = len(data)
-    for n in range(networks) :
-        points_array = np.array(data[n])
-        n_columns = int(points_array.shape[0])
-        n_rows = int(points_array.shape[1])
-        
-        X = np.zeros((n_rows, n_columns, 1))
-        Y = np.zeros((n_rows, n_columns, 1))
-        Z = np.zeros((n_rows, n_columns, 1))
-        
-        for i in range(n_columns) :
-            for j in range(n_rows) :
-                X[j, i, 0] = points_array[i, j, 0]
-                Y[j, i, 0] = points_array[i, j, 1]
-                Z[j, i, 0] = points_array[i, j, 2]
-                
-        evtk.hl.gridToVTK(filename+'_network'+str(n+1), X, Y, Z)
-
+    networks = OrderedDict()
+    for n, points in enumerate(data):
+        # vtk grids are indexed by row and then column
+        points = np.asarray(points, dtype=float)
+        networks[n+1] = (points[:, :, 0].T, points[:, :, 1].T,
+                         points[:, :, 2].T, None)
+
+    return _write_vtk_networks(networks, filename, directory, workers)
+
+
+def _write_vtk_networks(networks, filename, directory, workers):
+    # writes a structured grid file for each network concurrently and ties
+    # them together with a multiblock (.vtm) file
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        from pyevtk.hl import gridToVTK
+    except ImportError:
+        try:
+            from evtk.hl import gridToVTK
+        except ImportError:
+            raise ImportError("VTK export requires pyevtk, which is " +
+                              "installed with panairwrapper[vtk]")
+
+    def write_network(n):
+        X, Y, Z, point_data = networks[n]
+        if point_data is not None:
+            point_data = {k: _as_vtk_grid(v) for k, v in point_data.items()}
+        path = join(directory, filename+'_network'+str(n))
+        return gridToVTK(path, _as_vtk_grid(X), _as_vtk_grid(Y),
+                         _as_vtk_grid(Z), pointData=point_data)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        files = list(executor.map(write_network, networks))
+
+    vtm_file = join(directory, filename+'.vtm')
+    with open(vtm_file, 'w') as f:
+        f.write('<?xml version="1.0"?>\n')
+        f.write('<VTKFile type="vtkMultiBlockDataSet" version="1.0" ' +
+                'byte_order="LittleEndian">\n')
+        f.write('  <vtkMultiBlockDataSet>\n')
+        for i, (n, vts_file) in enumerate(zip(networks, files)):
+            f.write('    <DataSet index="{0}" name="network{1}" file="{2}"/>\n'
+                    .format(i, n, os.path.relpath(vts_file, directory)))
+        f.write('  </vtkMultiBlockDataSet>\n')
+        f.write('</VTKFile>\n')
+
+    return vtm_file
+
+
+def _as_vtk_grid(values):
+    # vtk structured grids take contiguous (rows, cols, 1) arrays
+    return np.ascontiguousarray(values, dtype=float)[:, :, np.newaxis]
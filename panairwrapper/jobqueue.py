@@ -0,0 +1,506 @@
+"""This module provides a job queue for spreading Panair runs over machines.
+
+The queue is kept in a SQLite database file. A coordinator submits cases
+to it as the text of their inputfile together with the metadata needed to
+read their results. Worker processes, on the same or on other machines
+sharing the file, claim jobs one at a time, run Panair on them in a
+workspace of their own and publish the parsed results back to the queue.
+
+Claiming a job gives the worker a lease on it, which the worker renews
+while Panair runs. If a worker crashes, its lease runs out and the job is
+handed to another worker. A job that fails, or whose worker is lost, is
+retried until it has been attempted max_attempts times.
+
+Example
+-------
+Coordinator:
+
+from panairwrapper.jobqueue import JobQueue
+
+queue = JobQueue("/shared/panair_jobs.db")
+job_ids = [queue.submit(case) for case in cases]
+queue.wait(job_ids)
+results = [queue.results(job_id) for job_id in job_ids]
+
+Worker, on each machine:
+
+python -m panairwrapper.jobqueue /shared/panair_jobs.db --exe ./panair
+
+Notes
+-----
+SQLite relies on file locking, which some network file systems don't
+implement correctly. The database should be kept on a file system with
+working POSIX locks.
+
+"""
+from collections import OrderedDict
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+import panairwrapper.cache as ch
+import panairwrapper.filehandling as fh
+import panairwrapper.workspace as ws
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    state TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_time REAL NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    result BLOB,
+    error TEXT,
+    submitted REAL NOT NULL,
+    finished REAL
+)
+"""
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """A queue of Panair runs kept in a SQLite database.
+
+    Parameters
+    ----------
+    path : str
+        Database file. It is created if it doesn't exist.
+    lease_time : float
+        Seconds a claimed job stays with its worker without a heartbeat
+        before it is handed to another worker.
+    max_attempts : int
+        Number of times a job is attempted before it is marked as failed.
+
+    Notes
+    -----
+    lease_time and max_attempts are stored with each job submitted through
+    this queue object, so that all workers agree on them whatever their
+    own settings.
+
+    """
+    def __init__(self, path, lease_time=60., max_attempts=3):
+        self._path = path
+        self._lease_time = lease_time
+        self._max_attempts = max_attempts
+        self._connection = sqlite3.connect(path, timeout=60.,
+                                           isolation_level=None,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._execute(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _transaction(self, func):
+        # runs func(connection) in a transaction holding the write lock of
+        # the database from the start, so that concurrent claims can't
+        # select the same job
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._connection)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+        return result
+
+    def submit(self, case, metadata=None):
+        """Adds a run of case to the queue and returns its job id.
+
+        Parameters
+        ----------
+        case : PanairWrapper
+            Case to run. Its inputfile is generated and stored in the queue,
+            so later changes to the case don't affect the job.
+        metadata : dict, optional
+            Additional JSON serializable data kept with the job.
+
+        """
+        directory = tempfile.mkdtemp(prefix="panair_submit_")
+        try:
+            copy = case._copy_case(directory)
+            copy._generate_inputfile()
+            with open(os.path.join(directory, case._filename)) as f:
+                deck = f.read()
+        finally:
+            shutil.rmtree(directory)
+
+        alphas, betas = case._case_angles()
+        job_metadata = {
+            'title': case._title,
+            'filename': case._filename,
+            'mach': float(case._aero_state[0]),
+            'alpha': alphas,
+            'beta': betas,
+            'offbody': case._offbody_points is not None,
+            'offbody_slices': [(name, s.start, s.stop) for name, s in
+                               case._offbody_slices().items()],
+            'user': metadata}
+
+        def insert(connection):
+            cursor = connection.execute(
+                "INSERT INTO jobs (state, deck, metadata, max_attempts, "
+                "lease_time, submitted) VALUES (?, ?, ?, ?, ?, ?)",
+                (PENDING, deck, json.dumps(job_metadata),
+                 self._max_attempts, self._lease_time, time.time()))
+            return cursor.lastrowid
+
+        return self._transaction(insert)
+
+    def claim(self, worker):
+        """Claims the oldest job available and returns it, or None.
+
+        Jobs whose worker's lease has run out are available again. Those
+        that have already been attempted max_attempts times are marked as
+        failed instead.
+
+        Returns
+        -------
+        dict
+            The id, deck, metadata, number of attempts and lease time of the
+            job.
+
+        """
+        def claim_job(connection):
+            now = time.time()
+            connection.execute(
+                "UPDATE jobs SET state = ?, error = ?, finished = ? "
+                "WHERE state = ? AND lease_expires < ? "
+                "AND attempts >= max_attempts",
+                (FAILED, "worker lost", now, RUNNING, now))
+            row = connection.execute(
+                "SELECT id, deck, metadata, attempts, lease_time FROM jobs "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1", (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET state = ?, worker = ?, "
+                "lease_expires = ?+lease_time, attempts = attempts+1 "
+                "WHERE id = ?", (RUNNING, worker, now, row[0]))
+
+            return {'id': row[0], 'deck': row[1],
+                    'metadata': json.loads(row[2]), 'attempts': row[3]+1,
+                    'lease_time': row[4]}
+
+        return self._transaction(claim_job)
+
+    def heartbeat(self, job_id, worker):
+        """Renews the lease of a claimed job.
+
+        Returns False if the job is no longer held by worker, e.g. because
+        its lease ran out and it was handed to another worker.
+
+        """
+        def renew(connection):
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ?+lease_time "
+                "WHERE id = ? AND worker = ? AND state = ?",
+                (time.time(), job_id, worker, RUNNING))
+            return cursor.rowcount == 1
+
+        return self._transaction(renew)
+
+    def complete(self, job_id, worker, arrays):
+        """Publishes the results of a job held by worker.
+
+        Parameters
+        ----------
+        arrays : dict of numpy arrays
+            Parsed results as returned by cache.parse_results.
+
+        """
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+
+        def store(connection):
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, "
+                "finished = ? WHERE id = ? AND worker = ? AND state = ?",
+                (DONE, buffer.getvalue(), time.time(), job_id, worker,
+                 RUNNING))
+            return cursor.rowcount == 1
+
+        return self._transaction(store)
+
+    def fail(self, job_id, worker, error):
+        """Reports that a job held by worker failed.
+
+        The job is queued again unless it has been attempted max_attempts
+        times, in which case it is marked as failed.
+
+        """
+        def release(connection):
+            cursor = connection.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts "
+                "THEN ? ELSE ? END, error = ?, finished = ?, "
+                "lease_expires = NULL WHERE id = ? AND worker = ? "
+                "AND state = ?",
+                (FAILED, PENDING, str(error), time.time(), job_id, worker,
+                 RUNNING))
+            return cursor.rowcount == 1
+
+        return self._transaction(release)
+
+    def status(self, job_id):
+        """Returns the state, number of attempts and last error of a job."""
+        rows = self._execute("SELECT state, attempts, error FROM jobs "
+                             "WHERE id = ?", (job_id,))
+        if not rows:
+            raise RuntimeError("job "+str(job_id)+" does not exist")
+
+        return rows[0]
+
+    def counts(self):
+        """Returns the number of jobs in each state."""
+        counts = OrderedDict((state, 0) for state in
+                             [PENDING, RUNNING, DONE, FAILED])
+        for state, count in self._execute("SELECT state, COUNT(*) FROM jobs "
+                                          "GROUP BY state"):
+            counts[state] = count
+
+        return counts
+
+    def wait(self, job_ids=None, timeout=None, poll_interval=1.):
+        """Waits until the given jobs, or all jobs, are done or failed."""
+        end = None if timeout is None else time.monotonic()+timeout
+        while True:
+            if job_ids is None:
+                counts = self.counts()
+                unfinished = counts[PENDING]+counts[RUNNING]
+            else:
+                unfinished = sum(self.status(i)[0] in (PENDING, RUNNING)
+                                 for i in job_ids)
+            if unfinished == 0:
+                return
+            if end is not None and time.monotonic() > end:
+                raise RuntimeError("jobs did not finish within timeout")
+            time.sleep(poll_interval)
+
+    def results(self, job_id, directory=None):
+        """Returns the Results of a finished job.
+
+        Parameters
+        ----------
+        job_id : int
+            Id of the job.
+        directory : str, optional
+            Folder the files written by the Results, e.g. by write_agps, are
+            placed in. If None, a folder has to be given to those methods.
+
+        Raises
+        ------
+        RuntimeError
+            If the job isn't done.
+
+        """
+        # imported here as panairwrapper.panairwrapper is not needed by
+        # workers
+        from panairwrapper.panairwrapper import Results
+
+        rows = self._execute("SELECT state, result, metadata, error "
+                             "FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            raise RuntimeError("job "+str(job_id)+" does not exist")
+        state, result, metadata, error = rows[0]
+        if state != DONE:
+            raise RuntimeError("job "+str(job_id)+" is "+state +
+                               ("" if error is None else ": "+error))
+
+        with np.load(io.BytesIO(result)) as data:
+            arrays = {name: data[name] for name in data.files}
+        slices = OrderedDict(
+            (name, slice(start, stop)) for name, start, stop in
+            json.loads(metadata)['offbody_slices'])
+
+        return Results(directory, ch.CachedOutputFiles(arrays), slices)
+
+
+def run_worker(path, exe, worker=None, workspace=None, max_jobs=None,
+               idle_timeout=None, poll_interval=1., timeout=None):
+    """Runs the jobs of a queue until there are none left.
+
+    Parameters
+    ----------
+    path : str
+        Database file of the queue.
+    exe : str
+        Path to the Panair executable.
+    worker : str, optional
+        Name identifying the worker. Defaults to the host name and process
+        id.
+    workspace : str, optional
+        Folder the jobs are run in. If None, a temporary folder is used.
+    max_jobs : int, optional
+        Maximum number of jobs to run.
+    idle_timeout : float, optional
+        Seconds to wait for new jobs once the queue is empty. If None, the
+        worker returns as soon as no job is pending or running.
+    poll_interval : float
+        Seconds between checks for new jobs.
+    timeout : float, optional
+        Time in seconds Panair is allowed to run on a job.
+    Returns
+    -------
+    int
+        Number of jobs run.
+
+    """
+    if worker is None:
+        worker = "{0}:{1}".format(socket.gethostname(), os.getpid())
+    owns_workspace = workspace is None
+    if workspace is None:
+        workspace = tempfile.mkdtemp(prefix="panair_worker_")
+    elif not os.path.exists(workspace):
+        os.makedirs(workspace)
+    exe = os.path.abspath(exe)
+    ws.link_executable(exe, workspace)
+
+    n_jobs = 0
+    idle_since = None
+    queue = JobQueue(path)
+    try:
+        while max_jobs is None or n_jobs < max_jobs:
+            job = queue.claim(worker)
+            if job is None:
+                counts = queue.counts()
+                if idle_timeout is None and counts[RUNNING] == 0:
+                    break
+                if idle_since is None:
+                    idle_since = time.monotonic()
+                elif (idle_timeout is not None and
+                      time.monotonic()-idle_since > idle_timeout):
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            idle_since = None
+            n_jobs += 1
+            try:
+                arrays = _run_job(queue, job, worker, workspace, exe,
+                                  timeout)
+            except Exception as error:
+                queue.fail(job['id'], worker, repr(error))
+            else:
+                queue.complete(job['id'], worker, arrays)
+            ws.reset_workspace(workspace, keep=[os.path.basename(exe)])
+    finally:
+        queue.close()
+        if owns_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    return n_jobs
+
+
+def _run_job(queue, job, worker, workspace, exe, timeout=None):
+    # runs Panair on the deck of a job, renewing its lease while it runs,
+    # and returns the parsed results
+    metadata = job['metadata']
+    with open(os.path.join(workspace, metadata['filename']), 'w') as f:
+        f.write(job['deck'])
+
+    stop = threading.Event()
+    lost = []
+
+    def heartbeat():
+        # renews the lease until Panair has finished. Failed renewals are
+        # retried until the lease would have run out, after which Panair is
+        # killed as the job may have been given to another worker.
+        lease_time = job['lease_time']
+        renewed = time.monotonic()
+        while not stop.wait(lease_time/3.):
+            try:
+                held = queue.heartbeat(job['id'], worker)
+            except Exception as error:
+                logger.warning("renewing the lease of job %s failed: %r",
+                               job['id'], error)
+                if time.monotonic()-renewed < lease_time:
+                    continue
+                lost.append("lease could not be renewed: "+repr(error))
+            else:
+                if held:
+                    renewed = time.monotonic()
+                    continue
+                lost.append("lease was given to another worker")
+            p.kill()
+            return
+
+    p = subprocess.Popen(os.path.join(workspace, os.path.basename(exe)),
+                         stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                         cwd=workspace)
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    try:
+        p.communicate(metadata['filename'].encode('ascii'), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        p.wait()
+        raise RuntimeError("panair did not finish within timeout")
+    finally:
+        stop.set()
+        thread.join()
+    if lost:
+        raise RuntimeError("job "+str(job['id'])+" lost: "+lost[0])
+
+    output_file = fh.OutputFiles(workspace)
+    if not output_file.check_successful():
+        raise RuntimeError("panair run not successful")
+
+    return ch.parse_results(output_file, len(metadata['alpha']),
+                            metadata['offbody'])
+
+
+def main(args=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Runs the jobs of a Panair job queue.")
+    parser.add_argument("path", help="database file of the queue")
+    parser.add_argument("--exe", default="panair",
+                        help="Panair executable")
+    parser.add_argument("--workspace", help="folder jobs are run in")
+    parser.add_argument("--max-jobs", type=int)
+    parser.add_argument("--idle-timeout", type=float)
+    parser.add_argument("--timeout", type=float,
+                        help="time Panair is allowed to run on a job")
+    args = parser.parse_args(args)
+
+    n_jobs = run_worker(args.path, args.exe, workspace=args.workspace,
+                        max_jobs=args.max_jobs,
+                        idle_timeout=args.idle_timeout, timeout=args.timeout)
+    print("ran", n_jobs, "jobs")
+
+
+if __name__ == "__main__":
+    main()
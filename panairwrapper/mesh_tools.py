@@ -1,51 +1,188 @@
 """Turns a surface description into a panair network"""
 import numpy as np
-import sys
-from math import sin, cos, sqrt
-import panairwrapper.filehandling as fh
 
 
-def axisymmetric_surf(data_x, data_r, N_theta):
+def axisymmetric_surf(data_x, data_r, N_theta, max_axial=200):
+    """Revolves a profile from theta = pi to pi/2 and splits it into networks.
 
-    theta_start = np.pi  # radians
-    theta_end = np.pi/2.  # radians
+    See surface_of_revolution for the description of the parameters.
 
-    data_t = np.linspace(theta_start, theta_end, N_theta)
+    """
+    return surface_of_revolution(data_x, data_r, N_theta,
+                                 max_axial=max_axial)
+
+
+def surface_of_revolution(data_x, data_r, N_theta=None,
+                          theta_range=(np.pi, np.pi/2.), theta_spacing=None,
+                          max_axial=200):
+    """Builds networks by revolving profiles about the x-axis.
+
+    Parameters
+    ----------
+    data_x, data_r : 1D or 2D numpy array
+        Axial coordinates and radii of the profile. A batch of profiles with
+        the same number of points can be given as arrays of shape
+        (n_profiles, n_points).
+    N_theta : int
+        Number of points around the circumference. Not needed if
+        theta_spacing is an array.
+    theta_range : tuple of float
+        Start and end angles of the revolution in radians, measured from
+        the positive z-axis towards the positive y-axis. The default
+        revolves from the negative z-axis to the positive y-axis.
+    theta_spacing : str, callable or 1D numpy array, optional
+        Either 'linear' (default) or 'cosine', a function with the
+        signature of np.linspace, or the angles themselves.
+    max_axial : int or None
+        Maximum number of axial points per network. Longer surfaces are
+        split into several networks that share their boundary points. If
+        None, the surface is not split.
+
+    Returns
+    -------
+    list of 3D numpy arrays
+        The networks, each of shape (N_theta, n_axial, 3). For a batch of
+        profiles, a list of such lists is returned, one per profile.
+
+    """
+    data_x = np.asarray(data_x, dtype=float)
+    data_r = np.asarray(data_r, dtype=float)
+    data_t = _theta_points(N_theta, theta_range, theta_spacing)
+
+    surf_coords = revolve(data_x, data_r, data_t)
+
+    if surf_coords.ndim == 4:
+        return [split_axial(s, max_axial) for s in surf_coords]
+
+    return split_axial(surf_coords, max_axial)
+
+
+def revolve(data_x, data_r, data_t):
+    """Revolves profiles about the x-axis to the given angles.
+
+    Returns an array of shape (..., len(data_t), n_points, 3) where the
+    leading dimensions are those of a batch of profiles.
+
+    """
+    data_x = np.asarray(data_x, dtype=float)
+    data_r = np.asarray(data_r, dtype=float)
+    data_t = np.asarray(data_t, dtype=float)[:, np.newaxis]
 
-    surf_coords = np.zeros([len(data_t), len(data_x), 3])
+    shape = data_r.shape[:-1]+(len(data_t), data_r.shape[-1], 3)
+    surf_coords = np.empty(shape)
+    surf_coords[..., 0] = data_x[..., np.newaxis, :]
+    surf_coords[..., 1] = data_r[..., np.newaxis, :]*np.sin(data_t)
+    surf_coords[..., 2] = data_r[..., np.newaxis, :]*np.cos(data_t)
 
-    for i, t in enumerate(data_t):
-        for j, x in enumerate(data_x):
-            surf_coords[i, j, 0] = x
-            surf_coords[i, j, 1] = data_r[j]*sin(t)
-            surf_coords[i, j, 2] = data_r[j]*cos(t)
+    return surf_coords
 
-    num_points = len(data_x)
 
-    max_axial = 200
+def split_axial(surf_coords, max_axial=200):
+    """Splits a surface into networks of at most max_axial axial points.
+
+    Neighboring networks share their boundary points. The networks are
+    views of surf_coords.
+
+    """
+    num_points = surf_coords.shape[-2]
+    if max_axial is None or num_points <= max_axial:
+        return [surf_coords]
+
     num_network = int(num_points/max_axial)
     if not (num_points % max_axial) == 0:
         num_network += 1
     nn = int(num_points/num_network)
 
     network_list = []
-    if num_network > 1:
-        for i in range(num_network):
-            if i == num_network-1:
-                network_list.append(surf_coords[:, i*nn:])
-            else:
-                network_list.append(surf_coords[:, i*nn:(i+1)*nn+1])
-
-    else:
-        network_list.append(surf_coords)
+    for i in range(num_network):
+        if i == num_network-1:
+            network_list.append(surf_coords[..., i*nn:, :])
+        else:
+            network_list.append(surf_coords[..., i*nn:(i+1)*nn+1, :])
 
     return network_list
 
 
+def _theta_points(N_theta, theta_range, theta_spacing):
+    # angles at which profiles are revolved
+    if theta_spacing is None or isinstance(theta_spacing, str):
+        if theta_spacing in (None, 'linear'):
+            theta_spacing = np.linspace
+        elif theta_spacing == 'cosine':
+            theta_spacing = cosine_spacing
+        else:
+            raise RuntimeError("theta spacing "+theta_spacing+" not recognized")
+
+    if callable(theta_spacing):
+        if N_theta is None:
+            raise RuntimeError("N_theta must be given")
+        theta_start, theta_end = theta_range
+        return theta_spacing(theta_start, theta_end, N_theta)
+
+    return np.asarray(theta_spacing, dtype=float)
+
+
 def generate_wake(te_points, x_end, n_points=10, angle_of_attack=0.,
                   cos_spacing=False):
+    """Builds a wake network trailing from a row of trailing edge points.
+
+    The wake extends from each trailing edge point at the angle of attack
+    until it reaches x_end. Trailing edges with the same number of points
+    can be stacked along leading dimensions of te_points, with x_end then
+    being a scalar or an array of one value per trailing edge.
+
+    Returns
+    -------
+    numpy array
+        Wake points of shape (..., n_points, n_te, 3).
+
+    """
+    te_points = np.asarray(te_points, dtype=float)
+    x_end = np.asarray(x_end, dtype=float)[..., np.newaxis]
+
+    return _wake_points(te_points, x_end, n_points, angle_of_attack,
+                        cos_spacing)
+
+
+def generate_wakes(te_points_list, x_end, n_points=10, angle_of_attack=0.,
+                   cos_spacing=False):
+    """Builds the wake networks of several trailing edges at once.
+
+    Unlike generate_wake, the trailing edges may have different numbers of
+    points. All of them are processed in a single broadcast over points and
+    stations.
+
+    Parameters
+    ----------
+    te_points_list : list of 2D numpy arrays
+        Trailing edge points of each wake, each of shape (n_te, 3).
+    x_end : float or list of float
+        x coordinate where the wakes end, either common to all wakes or one
+        per wake.
+
+    Returns
+    -------
+    list of 3D numpy arrays
+        Wake points of each trailing edge, of shape (n_points, n_te, 3).
+
+    """
+    counts = [len(p) for p in te_points_list]
+    x_end = np.broadcast_to(np.asarray(x_end, dtype=float),
+                            (len(counts),))
+
+    wakes = _wake_points(np.concatenate(te_points_list),
+                         np.repeat(x_end, counts), n_points, angle_of_attack,
+                         cos_spacing)
+
+    return np.split(wakes, np.cumsum(counts)[:-1], axis=1)
+
+
+def _wake_points(te_points, x_end, n_points, angle_of_attack, cos_spacing):
+    # wake points of shape (..., n_points, n_te, 3) trailing from each
+    # trailing edge point to its value of x_end
+
     # check that x_end is downstream of all trailing edge points
-    if not np.all(te_points[:, 0] < x_end):
+    if not np.all(te_points[..., 0] < x_end):
         raise RuntimeError("wake must terminate downstream of trailing edge")
 
     if cos_spacing:
@@ -53,18 +190,14 @@ def generate_wake(te_points, x_end, n_points=10, angle_of_attack=0.,
     else:
         spacing = np.linspace
 
-    Ny = te_points.shape[0]
-    wake = np.zeros((n_points, Ny, 3))
     aoa_r = angle_of_attack*np.pi/180.
-    for j, p in enumerate(te_points):
-        x_te, y_te, z_te = p
-        length = (x_end-x_te)/np.cos(aoa_r)
-        X_0 = spacing(0., length, n_points)
-        X_r = X_0*np.cos(aoa_r)
-        Z_r = X_0*np.sin(aoa_r)
-        wake[:, j, 0] = x_te+X_r
-        wake[:, j, 1] = y_te
-        wake[:, j, 2] = z_te+Z_r
+    length = (x_end-te_points[..., 0])/np.cos(aoa_r)
+    X_0 = np.swapaxes(_spaced(spacing, 0., length, n_points), -1, -2)
+
+    wake = np.empty(X_0.shape+(3,))
+    wake[..., 0] = te_points[..., np.newaxis, :, 0]+X_0*np.cos(aoa_r)
+    wake[..., 1] = te_points[..., np.newaxis, :, 1]
+    wake[..., 2] = te_points[..., np.newaxis, :, 2]+X_0*np.sin(aoa_r)
 
     return wake
 
@@ -74,6 +207,10 @@ def meshparameterspace(shape=(20, 20), psi_limits=(None, None),
                        cos_spacing=False):
     """Builds curvilinear mesh inside parameter space.
 
+    The limits can be stacked along leading dimensions, e.g. with shape
+    (n_batch, n_eta, 2), to build a batch of meshes in one call. The
+    returned arrays then have shape (n_batch, n_psi, n_eta).
+
     """
     if cos_spacing:
         spacing = cosine_spacing
@@ -84,160 +221,317 @@ def meshparameterspace(shape=(20, 20), psi_limits=(None, None),
     psi_lower, psi_upper = psi_limits
     eta_lower, eta_upper = eta_limits
 
+    batch = np.broadcast_shapes(*[np.shape(l)[:-2] for l in
+                                  psi_limits+eta_limits if l is not None])
+
     # if limits aren't specified, set lower to 0 and upper to 1
     if psi_lower is None:
-        psi_lower = np.full((n_eta, 2), 0.)
-        eta_min = eta_lower[0, 1] if eta_lower is not None else 0.
-        eta_max = eta_upper[0, 1] if eta_upper is not None else 1.
-        psi_lower[:, 1] = spacing(eta_min, eta_max, n_eta)
+        psi_lower = np.full(batch+(n_eta, 2), 0.)
+        eta_min = eta_lower[..., 0, 1] if eta_lower is not None else 0.
+        eta_max = eta_upper[..., 0, 1] if eta_upper is not None else 1.
+        psi_lower[..., 1] = _spaced(spacing, eta_min, eta_max, n_eta)
     if psi_upper is None:
-        psi_upper = np.full((n_eta, 2), 1.)
-        eta_min = eta_lower[-1, 1] if eta_lower is not None else 0.
-        eta_max = eta_upper[-1, 1] if eta_upper is not None else 1.
-        psi_upper[:, 1] = spacing(eta_min, eta_max, n_eta)
+        psi_upper = np.full(batch+(n_eta, 2), 1.)
+        eta_min = eta_lower[..., -1, 1] if eta_lower is not None else 0.
+        eta_max = eta_upper[..., -1, 1] if eta_upper is not None else 1.
+        psi_upper[..., 1] = _spaced(spacing, eta_min, eta_max, n_eta)
     if eta_lower is None:
-        eta_lower = np.full((n_psi, 2), 0.)
-        psi_min = psi_lower[0, 0] if psi_lower is not None else 0.
-        psi_max = psi_upper[0, 0] if psi_upper is not None else 1.
-        eta_lower[:, 0] = spacing(psi_min, psi_max, n_psi)
+        eta_lower = np.full(batch+(n_psi, 2), 0.)
+        psi_min = psi_lower[..., 0, 0]
+        psi_max = psi_upper[..., 0, 0]
+        eta_lower[..., 0] = _spaced(spacing, psi_min, psi_max, n_psi)
     if eta_upper is None:
-        eta_upper = np.full((n_psi, 2), 1.)
-        psi_min = psi_lower[-1, 0] if psi_lower is not None else 0.
-        psi_max = psi_upper[-1, 0] if psi_upper is not None else 1.
-        eta_upper[:, 0] = spacing(psi_min, psi_max, n_psi)
+        eta_upper = np.full(batch+(n_psi, 2), 1.)
+        psi_min = psi_lower[..., -1, 0]
+        psi_max = psi_upper[..., -1, 0]
+        eta_upper[..., 0] = _spaced(spacing, psi_min, psi_max, n_psi)
 
     grid = mesh_curvilinear(psi_lower, psi_upper, eta_lower, eta_upper,
                             spacing)
 
     if flip:
-        grid = np.flipud(grid)
+        grid = grid[..., ::-1, :, :]
 
-    return grid[:, :, 0], grid[:, :, 1]
+    return grid[..., 0], grid[..., 1]
 
 
 def mesh_curvilinear(x_lower, x_upper, y_lower, y_upper, spacing=None):
+    """Builds a mesh between four boundaries in parameter space.
+
+    The x coordinates of the inner points are spaced between x_lower and
+    x_upper and the y coordinates between y_lower and y_upper.
+
+    Parameters
+    ----------
+    x_lower, x_upper : numpy array
+        Boundaries at the first and last index of the first mesh direction,
+        of shape (..., n_y, 2).
+    y_lower, y_upper : numpy array
+        Boundaries at the first and last index of the second mesh
+        direction, of shape (..., n_x, 2).
+    spacing : callable, optional
+        Function with the signature of np.linspace used to space the inner
+        points. It is called with arrays of start and stop points of shape
+        (..., 1) and must return the points along the last axis, as
+        cosine_spacing does. Defaults to np.linspace.
+
+    Returns
+    -------
+    numpy array
+        Mesh of shape (..., n_x, n_y, 2) where the leading dimensions are
+        those of a batch of stacked boundaries.
+
+    """
     if spacing is None:
         spacing = np.linspace
 
-    # verify that corner points match
-    xlyl = np.array_equal(x_lower[0], y_lower[0])
-    xlyu = np.array_equal(x_lower[-1], y_upper[0])
-    xuyl = np.array_equal(x_upper[0], y_lower[-1])
-    xuyu = np.array_equal(x_upper[-1], y_upper[-1])
-    # print(x_lower[0], y_lower[0])
-    # print(x_lower[-1], y_upper[0])
-    # print(x_upper[0], y_lower[-1])
-    # print(x_upper[-1], y_upper[-1])
+    x_lower, x_upper, y_lower, y_upper = _check_corners(x_lower, x_upper,
+                                                        y_lower, y_upper)
 
-    if not (xlyl and xlyu and xuyl and xuyu):
-        print(xlyl, xlyu, xuyl, xuyu)
-        raise RuntimeError("corner points do not match")
+    n_x = y_lower.shape[-2]
+    n_y = x_lower.shape[-2]
+    batch = np.broadcast_shapes(x_lower.shape[:-2], x_upper.shape[:-2],
+                                y_lower.shape[:-2], y_upper.shape[:-2])
 
-    n_x = y_lower.shape[0]
-    n_y = x_lower.shape[0]
+    grid = np.empty(batch+(n_x, n_y, 2))
 
-    grid = np.zeros((n_x, n_y, 2))
+    # inner points are spaced between corresponding limits in x and y
+    grid[..., 0] = np.swapaxes(_spaced(spacing, x_lower[..., 0],
+                                       x_upper[..., 0], n_x), -1, -2)
+    grid[..., 1] = _spaced(spacing, y_lower[..., 1], y_upper[..., 1], n_y)
 
-    # boundary points are set to match limits exactly
-    grid[0, :] = x_lower
-    grid[-1, :] = x_upper
-    grid[:, 0] = y_lower
-    grid[:, -1] = y_upper
+    _set_boundaries(grid, x_lower, x_upper, y_lower, y_upper)
+
+    return grid
+
+
+def mesh_coons(x_lower, x_upper, y_lower, y_upper, spacing=None):
+    """Builds a mesh between four boundaries by transfinite interpolation.
+
+    The inner points are given by the bilinearly blended Coons patch of the
+    boundaries, so that both coordinates follow all four boundaries. The
+    parameters and returned mesh are the same as for mesh_curvilinear,
+    except that spacing only sets the distribution of the blending
+    parameters.
+
+    """
+    if spacing is None:
+        spacing = np.linspace
+
+    x_lower, x_upper, y_lower, y_upper = _check_corners(x_lower, x_upper,
+                                                        y_lower, y_upper)
+
+    n_x = y_lower.shape[-2]
+    n_y = x_lower.shape[-2]
+
+    u = _spaced(spacing, 0., 1., n_x)[:, np.newaxis, np.newaxis]
+    v = _spaced(spacing, 0., 1., n_y)[:, np.newaxis]
+
+    # corner points
+    c_ll = x_lower[..., np.newaxis, np.newaxis, 0, :]
+    c_lu = x_lower[..., np.newaxis, np.newaxis, -1, :]
+    c_ul = x_upper[..., np.newaxis, np.newaxis, 0, :]
+    c_uu = x_upper[..., np.newaxis, np.newaxis, -1, :]
 
-    # inner points are evenly spaced between corresponding limits in x and y
-    for i in range(1, n_x-1):
-        grid[i, 1:-1, 1] = spacing(y_lower[i, 1], y_upper[i, 1], n_y)[1:-1]
-    for j in range(1, n_y-1):
-        grid[1:-1, j, 0] = spacing(x_lower[j, 0], x_upper[j, 0], n_x)[1:-1]
+    grid = ((1.-u)*x_lower[..., np.newaxis, :, :] +
+            u*x_upper[..., np.newaxis, :, :] +
+            (1.-v)*y_lower[..., :, np.newaxis, :] +
+            v*y_upper[..., :, np.newaxis, :] -
+            (1.-u)*(1.-v)*c_ll - (1.-u)*v*c_lu - u*(1.-v)*c_ul - u*v*c_uu)
+
+    _set_boundaries(grid, x_lower, x_upper, y_lower, y_upper)
 
     return grid
 
 
-def cosine_spacing(start, stop, num=50, offset=0):
-    # calculates the cosine spacing
-    index = np.linspace(0., 1., num)
-    spacing = .5*(1.-np.cos(np.pi*(index-offset)))
+def _check_corners(x_lower, x_upper, y_lower, y_upper):
+    # verify that corner points match
+    x_lower, x_upper, y_lower, y_upper = [np.asarray(b, dtype=float) for b
+                                          in (x_lower, x_upper, y_lower,
+                                              y_upper)]
+    xlyl = np.array_equal(x_lower[..., 0, :], y_lower[..., 0, :])
+    xlyu = np.array_equal(x_lower[..., -1, :], y_upper[..., 0, :])
+    xuyl = np.array_equal(x_upper[..., 0, :], y_lower[..., -1, :])
+    xuyu = np.array_equal(x_upper[..., -1, :], y_upper[..., -1, :])
 
-    points = start+spacing*(stop-start)
+    if not (xlyl and xlyu and xuyl and xuyu):
+        print(xlyl, xlyu, xuyl, xuyu)
+        raise RuntimeError("corner points do not match")
 
-    return points
+    return x_lower, x_upper, y_lower, y_upper
 
 
-def _distance_point_to_line(P1, P2, PQ):
-    x0, y0 = PQ
-    x1, y1 = P1
-    x2, y2 = P2
-    dy = y2-y1
-    dx = x2-x1
+def _set_boundaries(grid, x_lower, x_upper, y_lower, y_upper):
+    # boundary points are set to match limits exactly
+    grid[..., 0, :, :] = x_lower
+    grid[..., -1, :, :] = x_upper
+    grid[..., :, 0, :] = y_lower
+    grid[..., :, -1, :] = y_upper
 
-    return abs(dy*x0-dx*y0+x2*y1-y2*x1)/sqrt(dy*dy+dx*dx)
 
+def _spaced(spacing, start, stop, num):
+    # spaces num points between each pair of start and stop points, giving
+    # an array of shape start.shape+(num,)
+    start = np.asarray(start, dtype=float)
+    stop = np.asarray(stop, dtype=float)
+    if spacing is np.linspace:
+        return np.linspace(start, stop, num, axis=-1)
 
-def _calc_error(point_list):
-    # calculates error if all points between endpoints of point_list
-    # were removed.
-    error = 0.
-    front = point_list[0]
-    back = point_list[-1]
-    for i in range(1, len(point_list)-1):
-        error += _distance_point_to_line(front, back, point_list[i])
+    points = spacing(start[..., np.newaxis], stop[..., np.newaxis], num)
 
-    return error
+    return np.broadcast_to(points, np.broadcast(start, stop).shape+(num,))
 
 
-def _calc_length(point_list):
-    # calculates error if all points between endpoints of point_list
-    # were removed.
-    x_f, y_f = point_list[0]
-    x_b, y_b = point_list[-1]
+def cosine_spacing(start, stop, num=50, offset=0):
+    # calculates the cosine spacing, start and stop may be arrays of shape
+    # (..., 1) giving points along the last axis
+    index = np.linspace(0., 1., num)
+    spacing = .5*(1.-np.cos(np.pi*(index-offset)))
 
-    length = sqrt((x_b-x_f)**2+(y_b-y_f)**2)
+    points = start+spacing*(stop-start)
 
-    return length
+    return points
 
 
 def coarsen_axi(data_x, data_r, tol, max_length):
-    # move x and r data into a list of "points"
-    point_list = []
-    for i in range(len(data_x)):
-        point_list.append(np.array([data_x[i], data_r[i]]))
+    """Removes points from a profile where they add little to its shape.
+
+    Starting from the first point, each segment of the profile is grown
+    until the summed distance of its inner points to the chord reaches tol
+    or the chord becomes longer than max_length. The inner points of the
+    segment are then dropped.
+
+    Parameters
+    ----------
+    data_x, data_r : 1D numpy array
+        Axial coordinates and radii of the profile.
+    tol : float
+        Maximum summed distance of removed points to the chord replacing
+        them.
+    max_length : float
+        Maximum length of a chord replacing removed points.
+
+    Returns
+    -------
+    new_x, new_r : 1D numpy array
+        Coordinates of the remaining points. The first and last points of
+        the profile are always kept.
+
+    """
+    points = np.column_stack((data_x, data_r)).astype(float)
 
-    # ITERATIVE ALGORITHM
     # Indices for the start and end points of the algorithm
     Pstart = 0
-    Pend = len(point_list)-1
-    # Indices for 2 pointers that define current range being examined
-    P1 = Pstart
-    P2 = Pstart+2
+    Pend = len(points)-1
 
-    new_point_list = [point_list[Pstart]]
-
-    while P2 <= Pend:
-        error = _calc_error(point_list[P1:P2+1])
+    keep = [Pstart]
+    P1 = Pstart
+    while P1+2 <= Pend:
+        error = _window_errors(points, P1, np.array([P1+2]))[0]
 
         if error > tol:
-            new_point_list.extend(point_list[P1+1:P2+1])
-            P1 = P2
-            P2 = P1 + 2
+            keep.extend((P1+1, P1+2))
+            P1 += 2
+        elif not error < tol:
+            keep.append(P1+1)
+            P1 += 1
         else:
-            while error < tol and P2 <= Pend:
-                P2 += 1
-                error = _calc_error(point_list[P1:P2+1])
-                cell_length = _calc_length(point_list[P1:P2+1])
-                # print(cell_length)
-                if cell_length > max_length:
-                    error += tol*10.
-            P2 -= 1
-            new_point_list.append(point_list[P2])
-            P1 = P2
-            P2 = P1 + 2
-
-    print("size of new list", len(new_point_list))
-    sys.stdout.flush()
-    new_x = np.zeros(len(new_point_list))
-    new_r = np.zeros(len(new_point_list))
-    for i in range(1, len(new_point_list)):
-        new_x[i] = new_point_list[i][0]
-        new_r[i] = new_point_list[i][1]
-
-    return new_x, new_r
+            P1 = _grow_segment(points, P1, tol, max_length)
+            keep.append(P1)
+
+    if keep[-1] != Pend:
+        keep.append(Pend)
+
+    new_points = points[keep]
+
+    return new_points[:, 0], new_points[:, 1]
+
+
+def _grow_segment(points, P1, tol, max_length):
+    # returns the last point of the longest segment starting at P1 whose
+    # inner points can be removed, checking end points in growing blocks.
+    # The distances of the inner points before a block are summed with a
+    # _DirectionSums, those inside the block directly, so that a segment of
+    # n points takes O(n log^2 n) time.
+    Pend = len(points)-1
+    inner = _DirectionSums()
+    inner.add(points[P1+1:P1+3]-points[P1])
+    start = P1+3
+    block = 8
+    while start <= Pend:
+        block = min(2*block, 256)
+        ends = np.arange(start, min(start+block, Pend+1))
+        chords = points[ends]-points[P1]
+        lengths = np.hypot(chords[:, 0], chords[:, 1])
+
+        # points inside the block are inner points of the later ends
+        new = points[start:ends[-1]]-points[P1]
+        cross = np.abs(np.outer(chords[:, 0], new[:, 1]) -
+                       np.outer(chords[:, 1], new[:, 0]))
+        cross[np.arange(len(new)) >= np.arange(len(ends))[:, np.newaxis]] = 0.
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            errors = (inner.abs_cross(chords)+cross.sum(axis=1))/lengths
+        failed = ~((errors < tol) & (lengths <= max_length))
+        if failed.any():
+            return ends[np.argmax(failed)]-1
+
+        inner.add(points[start:ends[-1]+1]-points[P1])
+        start = ends[-1]+1
+
+    return Pend
+
+
+class _DirectionSums:
+    # set of vectors d_i for summing the absolute cross products |c x d_i|
+    # with many vectors c at once. The vectors are kept in runs sorted by
+    # direction, with prefix sums, that are merged like the digits of a
+    # binary counter. The vectors on the left of c form one or two ranges
+    # of directions in each run, so the sum is twice their cross product
+    # with c minus that of all vectors.
+    def __init__(self):
+        self._runs = []
+
+    def add(self, vectors):
+        angles = np.arctan2(vectors[:, 1], vectors[:, 0])
+        while self._runs and len(self._runs[-1][0]) <= 2*len(angles):
+            last_angles, last_vectors, last_sums = self._runs.pop()
+            angles = np.concatenate((last_angles, angles))
+            vectors = np.concatenate((last_vectors, vectors))
+        order = np.argsort(angles, kind='stable')
+        sums = np.concatenate((np.zeros((1, 2)),
+                               np.cumsum(vectors[order], axis=0)))
+        self._runs.append((angles[order], vectors[order], sums))
+
+    def abs_cross(self, chords):
+        phi = np.arctan2(chords[:, 1], chords[:, 0])
+        upper = np.where(phi <= 0., phi+np.pi, phi-np.pi)
+        wraps = (phi > 0.)[:, np.newaxis]
+
+        # vectors with directions in (phi, phi+pi) are on the left of c
+        left = np.zeros((len(chords), 2))
+        total = np.zeros(2)
+        for angles, vectors, sums in self._runs:
+            below = sums[np.searchsorted(angles, phi, 'right')]
+            above = sums[np.searchsorted(angles, upper, 'left')]
+            left += above-below+wraps*sums[-1]
+            total += sums[-1]
+        left_cross = chords[:, 0]*left[:, 1]-chords[:, 1]*left[:, 0]
+        total_cross = chords[:, 0]*total[1]-chords[:, 1]*total[0]
+
+        return np.maximum(2.*left_cross-total_cross, 0.)
+
+
+def _window_errors(points, P1, ends):
+    # calculates the summed distance of the points between P1 and each of
+    # the end points to the chord connecting them
+    inner = points[P1+1:ends[-1]]-points[P1]
+    chords = points[ends]-points[P1]
+
+    cross = np.abs(np.outer(chords[:, 0], inner[:, 1]) -
+                   np.outer(chords[:, 1], inner[:, 0]))
+    outside = np.arange(len(inner)) >= (ends-P1-1)[:, np.newaxis]
+    cross[outside] = 0.
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cross.sum(axis=1)/np.hypot(chords[:, 0], chords[:, 1])
@@ -54,14 +54,24 @@ TODO: Move usage explanation to README.md
 
 """
 from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
 import panairwrapper.filehandling as fh
+import panairwrapper.workspace as ws
+from panairwrapper.progress import OutputMonitor
+import copy
+import itertools
+import logging
 import os
 import sys
 import subprocess
 import shutil
+import time
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
+
 class PanairWrapper:
     """The primary access point for specifying and running a case.
 
@@ -92,27 +102,33 @@ class PanairWrapper:
         self._aero_state = None
         self._ref_data = None
         self._symmetry = [True, False]
-        self._networks = []
+        self._networks = NetworkRegistry()
+        self._wakes = OrderedDict()
         self._offbody_points = None
+        self._offbody_sets = OrderedDict()
         self._results = Results(self._directory)
         self._panair_exec = exe
         self._panair_loc = os.path.join(os.path.dirname(__file__), "..")
+        # where the text of each network was written in the last inputfile,
+        # see fh.InputFile
+        self._render_cache = {}
 
     def _generate_inputfile(self):
 
         # Build inputfile, specifying defaults when necessary
-        inputfile = fh.InputFile()
+        inputfile = fh.InputFile(streaming=True, cache=self._render_cache)
         inputfile.title(self._title, self._description)
         inputfile.datacheck(0)
         inputfile.symmetric(int(self._symmetry[0]), int(self._symmetry[1]))
 
         # aerodynamic state inputs
         if self._aero_state is not None:
-            mach_number, alpha, beta = self._aero_state
+            mach_number = self._aero_state[0]
+            alphas, betas = self._case_angles()
             inputfile.mach(mach_number)
-            inputfile.cases(1)
-            inputfile.anglesofattack(alpha, [alpha])
-            inputfile.yawangle(beta, [beta])
+            inputfile.cases(len(alphas))
+            inputfile.anglesofattack(alphas[0], alphas)
+            inputfile.yawangle(betas[0], betas)
         else:
             raise RuntimeError("Aero state inputs must be provided.")
 
@@ -126,23 +142,10 @@ class PanairWrapper:
 
         # network inputs
         if len(self._networks) > 0:
-            network_list = list(self._networks)
-
             # add networks to inputfile, grouping them by network type
-            while network_list:
-                # remove first network from list
-                sub_list = [network_list.pop(0)]
-
-                # determine all networks that are of the same type as this network
-                matching_networks = [n for n in network_list if n[2] == sub_list[0][2]]
-                sub_list.extend(matching_networks)
-
-                # remove all networks of this type from network list
-                network_list[:] = [n for n in network_list if not n[2] == sub_list[0][2]]
-
+            for n_type, sub_list in self._networks.grouped_by_type():
                 # format network data for adding to inpufile
                 count = len(sub_list)
-                n_type = sub_list[0][2]
                 net_names = [n[0] for n in sub_list]
                 net_data = [n[1] for n in sub_list]
 
@@ -151,19 +154,61 @@ class PanairWrapper:
         else:
             raise RuntimeError("Network inputs must be provided.")
 
+        # trailing wake inputs, grouping them by network type and matchw
+        wake_groups = OrderedDict()
+        for wake_name, wake in self._wakes.items():
+            if wake[0] not in self._networks:
+                raise RuntimeError("wake "+wake_name+" is attached to " +
+                                   "unknown network "+wake[0])
+            wake_groups.setdefault(wake[4:], []).append((wake_name,)+wake[:4])
+        for (kt, matchw), sub_list in wake_groups.items():
+            names, inat, insd, xwake, twake = zip(*sub_list)
+            inputfile.trailingwakenetworks(len(sub_list), kt, matchw, names,
+                                           inat, insd, xwake, twake)
+
         # offbody inputs
         if self._offbody_points is not None:
             inputfile.flowfieldproperties(1., 0.)
             inputfile.xyzcoordinatesofoffbodypoints(len(self._offbody_points),
                                                     self._offbody_points)
+        self._results._offbody_slices = self._offbody_slices()
 
-        # write inputfile
+        # write inputfile, copying the text of unchanged networks from the
+        # previous one
         inputfile.write_inputfile(os.path.join(self._directory,
                                                self._filename))
 
     def set_aero_state(self, mach=0, alpha=0, beta=0):
+        """Sets the freestream conditions.
+
+        Parameters
+        ----------
+        mach : float
+            Freestream Mach number.
+        alpha, beta : float or list of floats
+            Angle of attack and yaw angle in degrees. If lists are given,
+            each pair of angles becomes a separate case of a single Panair
+            run, which reuses one factorization of the influence matrix for
+            all of them. A single value is used for every case. The results
+            of each case are retrieved through the case argument of the
+            Results methods.
+
+        """
         self._aero_state = [mach, alpha, beta]
 
+    def _case_angles(self):
+        # returns the angles of attack and yaw angles of each case
+        alphas = np.atleast_1d(self._aero_state[1]).tolist()
+        betas = np.atleast_1d(self._aero_state[2]).tolist()
+        if len(alphas) == 1:
+            alphas = alphas*len(betas)
+        if len(betas) == 1:
+            betas = betas*len(alphas)
+        if len(alphas) != len(betas):
+            raise RuntimeError("number of alphas and betas must match")
+
+        return alphas, betas
+
     def set_reference_data(self, area, span, chord, X0=[0., 0., 0.]):
         self._ref_data = [X0, area, span, chord]
 
@@ -194,23 +239,136 @@ class PanairWrapper:
             _network_data = np.swapaxes(network_data, 0, 1)
         else:
             _network_data = network_data
-        found = False
-        for n in self._networks:
-            if n[0] == network_name:
-                n[1] = _network_data
-                n[2] = network_type
-                found = True
 
-        if not found:
-            self._networks.append([network_name, _network_data, network_type])
+        self._networks.add(network_name, _network_data, network_type)
+
+    def add_networks(self, networks, network_type=1, xy_indexing=False):
+        """Adds or replaces several networks of the same type at once.
+
+        Parameters
+        ----------
+        networks : dict or list of (str, 3D numpy array)
+            Names and coordinates of the networks, see add_network.
+        network_type : int
+            Panair network type of all of the networks.
+
+        """
+        if isinstance(networks, dict):
+            networks = networks.items()
+        for network_name, network_data in networks:
+            self.add_network(network_name, network_data, network_type,
+                             xy_indexing)
+
+    def remove_network(self, *network_names):
+        """Removes the networks with the given names."""
+        for network_name in network_names:
+            self._networks.remove(network_name)
 
     def clear_networks(self):
-        self._networks = []
+        self._networks.clear()
+
+    def add_wake(self, wake_name, network_name, edge, x_end, twake=0,
+                 network_type=18, matchw=0):
+        """Adds a wake trailing from an edge of a network.
+
+        The wake network is generated by Panair from the points of the edge.
+        Replaces existing wake if wake with specified name already exists.
+
+        Parameters
+        ----------
+        wake_name : str
+            Name of wake being added.
+        network_name : str
+            Name of the network the wake is attached to.
+        edge : int
+            Number of the network edge the wake trails from. See Panair
+            documentation for the numbering of edges.
+        x_end : float
+            x-coordinate where the wake ends.
+        twake : int
+            If 0, the wake is parallel to the x-axis. If 1, it is parallel to
+            the freestream.
+        network_type : int
+            Panair network type of the wake, either 18 or 20.
+        matchw : int
+            If 1, the wake doublet strength is matched to the edge it trails
+            from. See Panair documentation for details.
+
+        """
+        self._wakes[wake_name] = (network_name, edge, x_end, twake,
+                                  network_type, matchw)
 
-    def add_offbody_points(self, offbody_points):
-        self._offbody_points = offbody_points
+    def remove_wake(self, *wake_names):
+        """Removes the wakes with the given names."""
+        for wake_name in wake_names:
+            if wake_name not in self._wakes:
+                raise RuntimeError("wake "+wake_name+" not found")
+            del self._wakes[wake_name]
+
+    def clear_wakes(self):
+        self._wakes.clear()
+
+    def add_offbody_points(self, offbody_points, name=None):
+        """Adds points at which off-body data is collected.
+
+        Parameters
+        ----------
+        offbody_points : 2D numpy array
+            Cartesian coordinates of the points, with shape (n, 3).
+        name : str, optional
+            If None, the points replace all other off-body points. Otherwise
+            they are added as a named set, replacing any set of the same
+            name, and kept after any unnamed points. All sets are evaluated
+            in the same Panair run and the data of each is retrieved with
+            Results.get_offbody_data(name=name).
+
+        """
+        if name is None:
+            # unnamed points are kept as a set without a name
+            self._offbody_sets = OrderedDict()
+        self._offbody_sets[name] = np.asarray(offbody_points)
+        if len(self._offbody_sets) == 1:
+            self._offbody_points = self._offbody_sets[name]
+        else:
+            self._offbody_points = np.concatenate(
+                list(self._offbody_sets.values()))
+
+    def clear_offbody_points(self):
+        self._offbody_sets = OrderedDict()
+        self._offbody_points = None
+
+    def _offbody_slices(self):
+        # rows of the off-body data belonging to each named set of points
+        slices = OrderedDict()
+        start = 0
+        for name, points in self._offbody_sets.items():
+            if name is not None:
+                slices[name] = slice(start, start+len(points))
+            start += len(points)
+
+        return slices
 
     def set_sensor(self, mach, aoa, r_over_l, l, n_lengths=1.8):
+        off_body_points = self._sensor_points(mach, aoa, r_over_l, l,
+                                              n_lengths)
+
+        self.add_offbody_points(off_body_points)
+
+    def add_sensor(self, name, mach, aoa, r_over_l, l, n_lengths=1.8):
+        """Adds a named sensor line to the off-body points.
+
+        Any number of sensors can be added. They are all evaluated against
+        the same solution in a single Panair run, and the data of each one
+        is retrieved with Results.get_offbody_data(name=name).
+
+        """
+        off_body_points = self._sensor_points(mach, aoa, r_over_l, l,
+                                              n_lengths)
+
+        self.add_offbody_points(off_body_points, name)
+
+    @staticmethod
+    def _sensor_points(mach, aoa, r_over_l, l, n_lengths):
         n_points = 1600
 
         mu = np.arcsin(1./mach)-aoa*np.pi/180.
@@ -221,14 +379,46 @@ class PanairWrapper:
         off_body_points[:, 0] = np.linspace(x_start, x_end, n_points)
         off_body_points[:, 2] = -R
 
-        self.add_offbody_points(off_body_points)
+        return off_body_points
 
     def set_symmetry(self, xz_symmetry, xy_symmetry):
         self._symmetry = [xz_symmetry, xy_symmetry]
 
-    def run(self, overwrite=True):
+    def run(self, overwrite=True, cache=None, timeout=None, callback=None,
+            progress=None, abort_patterns=None):
         """Generates Panair inputfile and runs case.
 
+        The text of the networks and off-body points that are unchanged
+        since the previous run of this object is copied from its last
+        inputfile instead of being formatted again. This only applies to
+        repeated runs of the same object, the cases run by sweep each start
+        from scratch.
+
+        Parameters
+        ----------
+        overwrite : bool
+            Whether to rerun the case if its directory already exists.
+        cache : ResultCache, optional
+            If given, the results of a previous run with an identical
+            inputfile are returned from the cache without running Panair,
+            and the results of new runs are added to it.
+        timeout : float, optional
+            Time in seconds Panair is allowed to run before it is killed.
+        callback : callable, optional
+            Called with the RunRecord of the run once it has finished, also
+            when it was not successful. The record is also logged to the
+            panairwrapper.panairwrapper logger at debug level and kept as
+            Results.run_record.
+        progress : callable, optional
+            Called with a ProgressEvent (see progress.OutputMonitor) each
+            time Panair starts a new block of panair.out while it runs.
+        abort_patterns : list of str, optional
+            Regular expressions searched for in the lines Panair writes to
+            panair.out and panair.err while it runs. Panair is killed as
+            soon as one of them matches. If only progress is given, the
+            ABORT line of panair.err is matched. Without either, the output
+            isn't monitored and Panair is waited for without polling.
+
         Returns
         -------
         Results
@@ -239,20 +429,321 @@ class PanairWrapper:
         Raises
         ------
         RuntimeError
-            If Panair does not finish successfully
+            If Panair does not finish successfully or is aborted
+        subprocess.TimeoutExpired
+            If Panair does not finish within timeout
 
 
         """
-        dir_exists = self._generate_dir(overwrite)
-        if overwrite or (not dir_exists):
-            print("running panair, please wait")
-            sys.stdout.flush()
-            self._generate_inputfile()
-            self._call_panair()
+        record = RunRecord(self._title, self._directory)
+        # results of this run, replaced by the cached ones on a cache hit
+        self._results = Results(self._directory,
+                                offbody_slices=self._offbody_slices())
+        try:
+            with record.phase("directory"):
+                dir_exists = self._generate_dir(overwrite)
+            if overwrite or (not dir_exists):
+                with record.phase("inputfile"):
+                    self._generate_inputfile()
+                self._count_inputs(record)
+
+                with record.phase("cache"):
+                    key, cached_results = self._check_cache(cache)
+                if cached_results is not None:
+                    record.cached = True
+                    self._results = cached_results
+                    self._report(record, cached_results, callback)
+                    return cached_results
+
+                print("running panair, please wait")
+                sys.stdout.flush()
+                with record.phase("panair"):
+                    self._call_panair(timeout, record, progress,
+                                      abort_patterns)
+
+                with record.phase("cache"):
+                    self._store_cache(cache, key)
+        except BaseException:
+            record.success = False
+            try:
+                self._report(record, self._results, callback)
+            except Exception:
+                # the error of the run is raised, not that of the callback
+                logger.exception("reporting the failed run failed")
+            raise
 
         print("Panair run finished.")
+        self._report(record, self._results, callback)
         return self._results
 
+    def _count_inputs(self, record):
+        # adds the size of the generated inputs to the run record
+        filename = os.path.join(self._directory, self._filename)
+        record.inputfile_size = os.path.getsize(filename)
+        record.n_networks = len(self._networks)
+        for name, data, network_type in self._networks:
+            nn, nm = data.shape[:2]
+            record.n_points += nn*nm
+            record.n_panels += (nn-1)*(nm-1)
+        if self._offbody_points is not None:
+            record.n_offbody_points = len(self._offbody_points)
+        record.n_cases = len(self._case_angles()[0])
+
+    @staticmethod
+    def _report(record, results, callback):
+        # hands the finished run record to the results, logger and callback
+        results.run_record = record
+        logger.debug("panair run %s", record.as_dict())
+        if callback is not None:
+            callback(record)
+
+    async def run_async(self, cache=None, timeout=None, callback=None,
+                        progress=None, abort_patterns=None):
+        """Generates Panair inputfile and runs case without blocking.
+
+        The inputfile is generated in a thread of the event loop's default
+        executor and Panair is run as an asyncio subprocess, so a single
+        event loop can drive many cases at once. The output of Panair to
+        stdout is discarded.
+
+        Parameters
+        ----------
+        cache : ResultCache, optional
+            See run.
+        timeout : float, optional
+            Time in seconds Panair is allowed to run. When it is exceeded,
+            or when the task is cancelled, the Panair process is killed and
+            the case directory is removed.
+        callback : callable, optional
+            See run. The CPU time and peak memory of the Panair process are
+            not measured for asynchronous runs.
+        progress, abort_patterns : optional
+            See run.
+
+        Returns
+        -------
+        Results
+
+        Raises
+        ------
+        RuntimeError
+            If Panair does not finish successfully or is aborted
+        asyncio.TimeoutError
+            If Panair does not finish within timeout
+
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        record = RunRecord(self._title, self._directory)
+        # results of this run, replaced by the cached ones on a cache hit
+        self._results = Results(self._directory,
+                                offbody_slices=self._offbody_slices())
+        try:
+            with record.phase("directory"):
+                await loop.run_in_executor(None, self._generate_dir, True)
+            with record.phase("inputfile"):
+                await loop.run_in_executor(None, self._generate_inputfile)
+            self._count_inputs(record)
+
+            with record.phase("cache"):
+                key, cached_results = self._check_cache(cache)
+            if cached_results is not None:
+                record.cached = True
+                self._results = cached_results
+                self._report(record, cached_results, callback)
+                return cached_results
+
+            with record.phase("panair"):
+                monitor = None
+                if progress is not None or abort_patterns:
+                    monitor = OutputMonitor(self._directory, progress,
+                                            abort_patterns)
+                p = await asyncio.create_subprocess_exec(
+                    self._linked_executable(),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL, cwd=self._directory)
+                try:
+                    await asyncio.wait_for(
+                        _communicate(p, self._filename.encode('ascii'),
+                                     monitor),
+                        timeout)
+                except BaseException:
+                    # timed out, aborted or cancelled
+                    if p.returncode is None:
+                        p.kill()
+                        await p.wait()
+                    self.clean_up()
+                    raise
+
+                if not self._results.check_successful():
+                    raise RuntimeError("panair run not successful")
+
+            with record.phase("cache"):
+                self._store_cache(cache, key)
+        except BaseException:
+            record.success = False
+            try:
+                self._report(record, self._results, callback)
+            except Exception:
+                # the error of the run is raised, not that of the callback
+                logger.exception("reporting the failed run failed")
+            raise
+
+        self._report(record, self._results, callback)
+        return self._results
+
+    def _check_cache(self, cache):
+        # looks up the generated inputfile in the cache, returning the cache
+        # key and the cached results if there are any
+        if cache is None:
+            return None, None
+
+        key = cache.key(os.path.join(self._directory, self._filename),
+                        os.path.join(self._panair_loc, self._panair_exec))
+        cached_output = cache.get(key)
+        if cached_output is None:
+            return key, None
+
+        print("Panair results found in cache.")
+        return key, Results(self._directory, cached_output,
+                            self._offbody_slices())
+
+    def _store_cache(self, cache, key):
+        # adds the results of the finished run to the cache. The run has
+        # succeeded at this point, so failing to cache it isn't an error.
+        if cache is None:
+            return
+        try:
+            cache.put(key, self._results._output_file,
+                      len(self._case_angles()[0]),
+                      self._offbody_points is not None)
+        except Exception:
+            logger.warning("results of %s could not be cached",
+                           self._directory, exc_info=True)
+
+    def sweep(self, mach=None, alpha=None, beta=None, workers=None,
+              cases_per_run=1, cache=None, workspace_pool=None,
+              workspace_timeout=60., memory_budget=None, cost_model=None,
+              abort_patterns=None):
+        """Runs the case for every combination of the given flow conditions.
+
+        Each run is done in its own folder under the case directory so that
+        the Panair instances don't interfere with each other. Up to workers
+        instances are run at the same time in a process pool, starting with
+        the runs predicted to take longest (see scheduler.run_batch).
+
+        Parameters
+        ----------
+        mach, alpha, beta : float or list of floats
+            Values to sweep over. Any value not given is taken from the
+            current aero state.
+        workers : int
+            Maximum number of Panair instances running at once. Defaults to
+            the number of processors on the machine.
+        cases_per_run : int
+            Number of angles of attack solved together as the cases of a
+            single Panair run at each Mach number and yaw angle.
+        cache : ResultCache, optional
+            Cache passed on to the run of each case (see run).
+        workspace_pool : WorkspacePool, optional
+            If given, each run is done in a workspace of the pool that is
+            reset between runs, instead of creating a folder for every run.
+            The workspaces free when the sweep starts are held for its
+            duration and bound the number of workers. The directory
+            reported for each case is then the workspace it ran in, which
+            is reused by later runs.
+        workspace_timeout : float
+            Seconds to wait for a workspace of workspace_pool if none is
+            free. A RuntimeError is raised if none becomes free in time.
+        memory_budget : float, optional
+            Maximum total predicted memory in bytes of the runs in progress,
+            see scheduler.run_batch.
+        cost_model : CostModel, optional
+            Model used to start the runs predicted to take longest first. It
+            is refined with the records of the finished runs.
+        abort_patterns : list of str, optional
+            Patterns killing a run as soon as they appear in its output, see
+            run. An aborted run frees its worker right away and its cases
+            are reported as unsuccessful. For example,
+            progress.DEFAULT_ABORT_PATTERNS stops runs as soon as Panair
+            reports ABORT.
+
+        Returns
+        -------
+        list of dict
+            One row per case, in the order of the sweep, holding mach,
+            alpha, beta, the case directory, whether the run was successful,
+            the forces and moments (see Results.get_forces_and_moments), the
+            off-body data under 'offbody' (None if no off-body points), the
+            error that made the run fail under 'error' (None if it was
+            successful) and the RunRecord of the run as a dict under
+            'run_record'.
+
+        """
+        # imported here to keep importing this module cheap
+        from panairwrapper.scheduler import run_batch
+
+        current = self._aero_state
+        if current is None:
+            current = [0., 0., 0.]
+        values = []
+        for value, default in zip([mach, alpha, beta], current):
+            if value is None:
+                value = default
+            values.append(np.atleast_1d(value).tolist())
+
+        machs, alphas, betas = values
+        alpha_groups = [alphas[i:i+cases_per_run]
+                        for i in range(0, len(alphas), cases_per_run)]
+
+        cases = []
+        for mach_number, beta_value in itertools.product(machs, betas):
+            for group in alpha_groups:
+                directory = os.path.join(self._directory, "sweep",
+                                         "case_{0:04d}".format(len(cases)))
+                case = self._copy_case(directory)
+                case.set_aero_state(mach_number, group, beta_value)
+                cases.append(case)
+
+        # the pool stays in this process, the workers are only handed the
+        # paths of the workspaces held for the sweep
+        workspaces = None
+        if workspace_pool is not None:
+            workspaces = [workspace_pool.acquire(workspace_timeout)]
+            while len(workspaces) < len(workspace_pool):
+                try:
+                    workspaces.append(workspace_pool.acquire(0.))
+                except RuntimeError:
+                    break
+
+        try:
+            results = run_batch(cases, workers, memory_budget, cost_model,
+                                cache, abort_patterns=abort_patterns,
+                                workspaces=workspaces)
+            rows = list(itertools.chain(*results))
+        finally:
+            if workspaces is not None:
+                for workspace in workspaces:
+                    workspace_pool.release(workspace)
+
+        # restore the order of the sweep
+        order = {state: i for i, state in
+                 enumerate(itertools.product(machs, alphas, betas))}
+        rows.sort(key=lambda r: order[(r['mach'], r['alpha'], r['beta'])])
+
+        return rows
+
+    def _copy_case(self, directory):
+        # returns a copy of this case that runs in the given directory
+        case = copy.copy(self)
+        case._directory = directory
+        case._results = Results(directory)
+        # the copy has no inputfile of its own yet to copy text from
+        case._render_cache = {}
+
+        return case
+
     def _generate_dir(self, overwrite):
         # create directory for case if it doesn't exist
         exists = os.path.exists(self._directory)
@@ -261,29 +752,55 @@ class PanairWrapper:
         else:
             if overwrite is True:
                 # remove old files
-                files = os.listdir(self._directory)
-                for f in files:
-                    if f.startswith('rwms'):
-                        os.remove(os.path.join(self._directory, f))
+                ws.reset_workspace(self._directory, prefix='rwms')
             elif overwrite is False:
                 pass
             else:
                 raise RuntimeError("option not recognized")
 
-        # copy in panair.exec
-        shutil.copy2(os.path.join(self._panair_loc, self._panair_exec), self._directory)
+        # link in panair.exec, unless it is already there
+        ws.link_executable(os.path.join(self._panair_loc, self._panair_exec),
+                           self._directory)
 
         return exists
 
+    def _linked_executable(self):
+        # the executable placed in the case directory by _generate_dir
+        return os.path.abspath(os.path.join(
+            self._directory, os.path.basename(self._panair_exec)))
+
     def clean_up(self):
         """Removes case folder and files"""
         if os.path.exists(self._directory):
             shutil.rmtree(self._directory)
 
-    def _call_panair(self):
-        p = subprocess.Popen(os.path.join(self._panair_loc, self._panair_exec), stdin=subprocess.PIPE,
+    def _call_panair(self, timeout=None, record=None, progress=None,
+                     abort_patterns=None):
+        monitor = None
+        if progress is not None or abort_patterns:
+            monitor = OutputMonitor(self._directory, progress, abort_patterns)
+        p = subprocess.Popen(self._linked_executable(), stdin=subprocess.PIPE,
                              cwd=self._directory)
-        p.communicate(self._filename.encode('ascii'))
+        try:
+            p.stdin.write(self._filename.encode('ascii'))
+            p.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            usage = _wait_child(p, timeout, monitor)
+        except BaseException:
+            # timed out or aborted
+            if p.returncode is None:
+                p.kill()
+                p.wait()
+            raise
+        if monitor is not None:
+            monitor.poll(final=True)
+
+        if record is not None and usage is not None:
+            record.cpu_user = usage.ru_utime
+            record.cpu_system = usage.ru_stime
+            record.max_rss = usage.ru_maxrss
 
         success = self._results.check_successful()
         print(success)
@@ -291,32 +808,312 @@ class PanairWrapper:
             raise RuntimeError("panair run not successful")
 
 
-class Results:
-    """Handles the parsing of Panair output files for data retrieval"""
+async def _communicate(p, data, monitor=None):
+    # sends data to the asyncio subprocess p and waits for it to finish,
+    # checking its output with monitor, if given, while waiting
+    import asyncio
+
+    task = asyncio.ensure_future(p.communicate(data))
+    try:
+        interval = 0.001
+        while monitor is not None:
+            await asyncio.wait([task], timeout=interval)
+            monitor.poll(final=task.done())
+            if task.done():
+                break
+            interval = min(2.*interval, 0.05)
+        await task
+    finally:
+        task.cancel()
+
+
+def _wait_child(p, timeout=None, monitor=None):
+    # waits for the process p to finish and returns its resource usage. On
+    # systems without os.wait4, None is returned instead. The output of the
+    # process is checked with monitor, if given, while waiting.
+    wait4 = hasattr(os, "wait4")
+    if timeout is None and monitor is None:
+        if not wait4:
+            p.wait()
+            return None
+        pid, status, usage = os.wait4(p.pid, 0)
+    else:
+        # poll with increasing intervals, so that short runs aren't delayed
+        end = None if timeout is None else time.monotonic()+timeout
+        interval = 0.001
+        while True:
+            if not wait4:
+                if p.poll() is not None:
+                    return None
+            else:
+                pid, status, usage = os.wait4(p.pid, os.WNOHANG)
+                if pid != 0:
+                    break
+            if monitor is not None:
+                monitor.poll()
+            if end is not None and time.monotonic() > end:
+                raise subprocess.TimeoutExpired(p.args, timeout)
+            time.sleep(interval)
+            interval = min(2.*interval, 0.05)
 
-    def __init__(self, directory):
-        self._output_file = fh.OutputFiles(directory)
-        self._directory = directory
+    p.returncode = _exit_code(status)
 
-    def get_offbody_data(self):
-        return self._output_file.get_offbody_data()
+    return usage
 
-    def get_forces_and_moments(self):
-        return self._output_file.get_forces_and_moments()
 
-    def check_successful(self):
-        return self._output_file.check_successful()
+def _exit_code(status):
+    # decodes a wait status the way subprocess does, giving the negative
+    # signal number for a process killed by a signal
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    raise RuntimeError("unknown wait status {0}".format(status))
+
+
+class NetworkRegistry:
+    """Keeps the networks of a case in the order they were added.
+
+    Networks are stored by name, so adding, replacing or removing a network
+    doesn't require searching through the other networks. Iterating over the
+    registry yields (name, data, type) tuples in insertion order, a replaced
+    network keeping its original position.
+
+    """
+    def __init__(self):
+        self._networks = OrderedDict()
+
+    def __len__(self):
+        return len(self._networks)
+
+    def __iter__(self):
+        for name, (data, network_type) in self._networks.items():
+            yield name, data, network_type
+
+    def __contains__(self, name):
+        return name in self._networks
+
+    def __getitem__(self, name):
+        data, network_type = self._networks[name]
+        return name, data, network_type
+
+    def add(self, name, data, network_type=1):
+        self._networks[name] = (data, network_type)
+
+    def update(self, networks):
+        for name, data, network_type in networks:
+            self.add(name, data, network_type)
+
+    def remove(self, name):
+        if name not in self._networks:
+            raise RuntimeError("network "+name+" does not exist")
+        self._networks.pop(name)
+
+    def clear(self):
+        self._networks.clear()
+
+    def names_of_type(self, network_type):
+        return [name for name, (data, n_type) in self._networks.items()
+                if n_type == network_type]
+
+    def grouped_by_type(self):
+        """Groups the networks by type in a single pass.
+
+        Returns
+        -------
+        list of (int, list of (str, 3D numpy array))
+            The network type and the networks of that type, in the order
+            in which each type first occurs in the registry.
+
+        """
+        groups = OrderedDict()
+        for name, (data, network_type) in self._networks.items():
+            groups.setdefault(network_type, []).append((name, data))
+
+        return list(groups.items())
+
+
+def _run_sweep_case(case, cache=None, abort_patterns=None, workspace=None):
+    # runs a single Panair run of a sweep, in the given workspace if any,
+    # and collects the results of each of its cases
+    from panairwrapper.sharedgeometry import restore
+
+    # any failure only fails the cases of this run, not the whole sweep
+    records = []
+    data = None
+    try:
+        case = restore(case)
+        if workspace is not None:
+            ws.reset_workspace(workspace,
+                               keep=[os.path.basename(case._panair_exec)])
+            case = case._copy_case(workspace)
+
+        results = case.run(cache=cache, callback=records.append,
+                           abort_patterns=abort_patterns)
+        cases = []
+        for i in range(len(case._case_angles()[0])):
+            offbody = None
+            if case._offbody_points is not None:
+                offbody = results.get_offbody_data(i)
+            cases.append((results.get_forces_and_moments(i), offbody))
+        data, error = cases, None
+    except Exception as e:
+        error = "{0}: {1}".format(type(e).__name__, e)
+
+    record = records[-1].as_dict() if records else None
+
+    return _sweep_rows(case, data, error, record)
+
+
+def _sweep_rows(case, data=None, error=None, record=None):
+    # rows of the cases of a sweep run as described in PanairWrapper.sweep.
+    # data holds the forces and moments and off-body data of each case, or
+    # is None if the run failed with the given error.
+    rows = []
+    for i, (alpha, beta) in enumerate(zip(*case._case_angles())):
+        row = OrderedDict([('mach', case._aero_state[0]), ('alpha', alpha),
+                           ('beta', beta), ('directory', case._directory)])
+        if data is None:
+            row['success'] = False
+            row.update((k, np.nan) for k in fh.FORCES_AND_MOMENTS)
+            row['offbody'] = None
+        else:
+            row['success'] = True
+            row.update(data[i][0])
+            row['offbody'] = data[i][1]
+        row['error'] = error
+        row['run_record'] = record
+        rows.append(row)
+
+    return rows
+
 
-    def write_agps(self):
-        agps_data = self._output_file.parse_agps()
+class RunRecord:
+    """Timings and resource use of a single Panair run.
 
-        with open(os.path.join(self._directory, "agps.csv"), 'w') as f:
-            for row in agps_data:
-                for i, v in enumerate(row):
-                    f.write(str(v))
-                    if i < 6:
-                        f.write(',')
-                f.write('\n')
+    Attributes
+    ----------
+    title : str
+        Title of the case.
+    directory : str
+        Folder the case was run in.
+    phases : OrderedDict
+        Wall time in seconds spent in each phase of the run: 'directory',
+        'inputfile', 'cache' (looking up and storing results), 'panair'
+        (the Panair process) and 'parse' (reading results through the
+        Results accessors, accumulated over all calls).
+    inputfile_size : int
+        Size of the inputfile in bytes.
+    n_networks, n_panels, n_points : int
+        Number of networks and their total number of panels and points.
+    n_offbody_points : int
+        Number of off-body points.
+    n_cases : int
+        Number of cases solved in the run.
+    cpu_user, cpu_system : float
+        CPU time in seconds used by the Panair process. None if the results
+        were cached or resource use can't be measured on this system.
+    max_rss : int
+        Peak resident set size of the Panair process as reported by the
+        system (in kilobytes on Linux). None if not measured.
+    cached : bool
+        Whether the results were taken from a ResultCache.
+    success : bool
+        Whether the run finished successfully.
+
+    """
+    def __init__(self, title, directory):
+        self.title = title
+        self.directory = directory
+        self.phases = OrderedDict()
+        self.inputfile_size = 0
+        self.n_networks = 0
+        self.n_panels = 0
+        self.n_points = 0
+        self.n_offbody_points = 0
+        self.n_cases = 0
+        self.cpu_user = None
+        self.cpu_system = None
+        self.max_rss = None
+        self.cached = False
+        self.success = True
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent in it to phases[name]."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter()-start
+            self.phases[name] = self.phases.get(name, 0.)+elapsed
+
+    @property
+    def wall_time(self):
+        """Total wall time of all phases in seconds."""
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        """Returns the record as a dict, e.g. for logging or json."""
+        record = OrderedDict(self.__dict__)
+        record['phases'] = OrderedDict(self.phases)
+        record['wall_time'] = self.wall_time
+
+        return record
 
-    def write_vtk(self):
-        self._output_file.generate_vtk()
+
+class Results:
+    """Handles the parsing of Panair output files for data retrieval"""
+
+    def __init__(self, directory, output_file=None, offbody_slices=None):
+        if output_file is None:
+            output_file = fh.OutputFiles(directory)
+        self._output_file = output_file
+        self._directory = directory
+        self._offbody_slices = offbody_slices
+        # RunRecord of the run that produced the results, see PanairWrapper.run
+        self.run_record = None
+
+    def _parsing(self):
+        # accumulates the time spent reading results in the run record
+        if self.run_record is None:
+            return nullcontext()
+        return self.run_record.phase("parse")
+
+    def get_offbody_data(self, case=0, name=None):
+        if name is not None and name not in (self._offbody_slices or {}):
+            raise KeyError("no set of off-body points named " + repr(name) +
+                           " in these results")
+        with self._parsing():
+            data = self._output_file.get_offbody_data(case)
+        if name is not None:
+            # only return rows of the named set of off-body points
+            data = data[self._offbody_slices[name]]
+
+        return data
+
+    def get_forces_and_moments(self, case=0):
+        with self._parsing():
+            return self._output_file.get_forces_and_moments(case)
+
+    def check_successful(self):
+        with self._parsing():
+            return self._output_file.check_successful()
+
+    def write_agps(self, case=0, filename="agps.csv", directory=None):
+        # written to the folder of the results unless directory is given
+        if directory is None:
+            directory = self._directory
+        if directory is None:
+            raise RuntimeError("results have no folder, the directory to "
+                               "write agps data to must be given")
+        with self._parsing():
+            agps_data = self._output_file.read_agps(case)
+
+        np.savetxt(os.path.join(directory, filename), agps_data,
+                   fmt='%s', delimiter=',')
+
+    def write_vtk(self, filename='panair', directory='.', workers=None,
+                  case=0):
+        return self._output_file.generate_vtk(filename, directory=directory,
+                                              workers=workers, case=case)
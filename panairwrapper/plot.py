@@ -2,25 +2,34 @@
 Module for plotting surfaces in a pyqtgraph 3D ViewWidget
 '''
 
-import pyqtgraph as pg
-import pyqtgraph.opengl as gl
 import numpy as np
-import panairwrapper as panw
 
-def plot(case, cols=[], hold=True):
+def plot(case, cols=[], hold=True, max_points=None, cp=False, cp_case=0):
     '''
     Function to plot a set of networks (from a PanairWrapper class instance) with pyqtgraph.
     parameters:
     * case: the panair case at hand
     * cols: array of colors to be attributed to the wireframe plot of each network
     * hold: whether to await for user pressing ENTER after plot is generated
+    * max_points: if given, networks with more points are decimated to about this many points by taking every n-th row and column
+    * cp: whether to color the surfaces by the pressure coefficient of a finished run
+    * cp_case: index of the case whose pressure coefficients are plotted
     '''
+    #the OpenGL stack is only imported when plotting, see the plot extra in setup.py
+    import pyqtgraph as pg
+    import pyqtgraph.opengl as gl
 
     #create Qt App
     qapp=pg.mkQApp()
 
-    #get networks as 3D arrays
-    arrs=[ntw[1] for ntw in case._networks]
+    #get networks as 3D arrays, in the order they are written to the inputfile
+    arrs=[ntw[1] for _, group in case._networks.grouped_by_type() for ntw in group]
+
+    #get pressure coefficients on the same grids as the networks
+    cps=_network_cps(case, arrs, cp_case) if cp else [None]*len(arrs)
+    if cp:
+        cp_min=min(c.min() for c in cps)
+        cp_max=max(c.max() for c in cps)
 
     #create OpenGL widget
     view=gl.GLViewWidget()
@@ -34,10 +43,13 @@ def plot(case, cols=[], hold=True):
     while len(cols)<len(arrs):
         cols.append(defcols[n])
         n=(n+1)%len(defcols)
-    
-    for arr, col in zip(arrs, cols):
-        _addplot(view, arr, items, meshes, col=pg.glColor(col))
-    
+
+    for arr, col, arr_cp in zip(arrs, cols, cps):
+        vert_cols=None
+        if arr_cp is not None:
+            vert_cols=_cp_colors(arr_cp, cp_min, cp_max)
+        _addplot(view, arr, items, meshes, col=pg.glColor(col), max_points=max_points, vert_cols=vert_cols)
+
     view.show()
 
     if hold:
@@ -46,36 +58,82 @@ def plot(case, cols=[], hold=True):
 def _hold():
     input('Press ENTER to continue ...')
 
-def _addplot(view, ntw, items, meshes, col=pg.glColor('w')):
-    #create mesh item
+def _addplot(view, ntw, items, meshes, col=None, max_points=None, vert_cols=None):
+    #create mesh item, sharing the network points between triangles
+    import pyqtgraph as pg
+    import pyqtgraph.opengl as gl
+
+    if col is None:
+        col=pg.glColor('w')
+
+    rows, cols=_decimation(ntw.shape[0], ntw.shape[1], max_points)
+    ntw=ntw[np.ix_(rows, cols)]
 
     nm=np.size(ntw, 0) #indexing assumes np.swapaxes in PanairCase.add_network method
     nn=np.size(ntw, 1)
-    verts=np.zeros((6*(nm-1)*(nn-1), 3))
-    faces=np.zeros((2*(nm-1)*(nn-1), 3), dtype='int')
-    n=0
-    nf=0
-    for i in range(nm-1):
-        for j in range(nn-1):
-            #first triangle
-            verts[n, :]=ntw[i, j, :]
-            verts[n+1, :]=ntw[i+1, j, :]
-            verts[n+2, :]=ntw[i+1, j+1, :]
-            faces[nf, :]=np.array([n, n+1, n+2], dtype='int')
-
-            #second triangle
-            verts[n+3, :]=ntw[i+1, j+1, :]
-            verts[n+4, :]=ntw[i, j+1, :]
-            verts[n+5, :]=ntw[i, j, :]
-            faces[nf+1, :]=np.array([n, n+1, n+2], dtype='int')+3
-            
-            n+=6
-            nf+=2
-    
-    mdata=gl.MeshData(vertexes=verts, faces=faces)
-    mitem=gl.GLMeshItem(meshdata=mdata, drawEdges=True, edgeColor=col, color=pg.glColor('w'))
+    verts=ntw.reshape(-1, 3)
+    faces=_faces(nm, nn)
+
+    if vert_cols is None:
+        mdata=gl.MeshData(vertexes=verts, faces=faces)
+        mitem=gl.GLMeshItem(meshdata=mdata, drawEdges=True, edgeColor=col, color=pg.glColor('w'))
+    else:
+        vert_cols=vert_cols[np.ix_(rows, cols)].reshape(-1, 4)
+        mdata=gl.MeshData(vertexes=verts, faces=faces, vertexColors=vert_cols)
+        mitem=gl.GLMeshItem(meshdata=mdata, drawEdges=True, edgeColor=col, smooth=True)
 
     view.addItem(mitem)
 
     items.append(mitem)
-    meshes.append(mdata)
\ No newline at end of file
+    meshes.append(mdata)
+
+def _faces(nm, nn):
+    #indices of the two triangles of each quad into the flattened (nm, nn) grid of points
+    index=np.arange(nm*nn).reshape(nm, nn)
+    p00=index[:-1, :-1].ravel()
+    p10=index[1:, :-1].ravel()
+    p11=index[1:, 1:].ravel()
+    p01=index[:-1, 1:].ravel()
+
+    faces=np.empty((2*(nm-1)*(nn-1), 3), dtype='int')
+    faces[0::2]=np.column_stack((p00, p10, p11))
+    faces[1::2]=np.column_stack((p11, p01, p00))
+
+    return faces
+
+def _decimation(nm, nn, max_points=None):
+    #indices of the rows and columns kept so that about max_points points remain, always keeping the edges
+    if max_points is None or nm*nn<=max_points:
+        return np.arange(nm), np.arange(nn)
+
+    stride=int(np.ceil(np.sqrt(nm*nn/max_points)))
+    rows=np.unique(np.append(np.arange(0, nm, stride), nm-1))
+    cols=np.unique(np.append(np.arange(0, nn, stride), nn-1))
+
+    return rows, cols
+
+def _network_cps(case, arrs, cp_case=0):
+    #pressure coefficients of each network from the agps file, on grids of the network shape
+    output_file=case._results._output_file
+    grids=output_file.get_agps_grids(output_file.read_agps(cp_case))
+    if len(grids)!=len(arrs):
+        raise RuntimeError("agps data does not match the networks of the case")
+
+    cps=[]
+    for arr, grid in zip(arrs, grids.values()):
+        cp=grid['cp'].T
+        if cp.shape!=arr.shape[:2]:
+            raise RuntimeError("agps data does not match the networks of the case")
+        cps.append(cp)
+
+    return cps
+
+def _cp_colors(cp, cp_min, cp_max):
+    #RGBA colors going from blue at cp_min over white to red at cp_max
+    t=(cp-cp_min)/max(cp_max-cp_min, 1e-12)
+    colors=np.ones(cp.shape+(4,))
+    colors[..., 0]=np.clip(2.*t, 0., 1.)
+    colors[..., 1]=1.-np.abs(2.*t-1.)
+    colors[..., 2]=np.clip(2.-2.*t, 0., 1.)
+
+    return colors
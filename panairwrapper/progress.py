@@ -0,0 +1,148 @@
+"""This module provides monitoring of the output of a running Panair process.
+
+Panair writes its results to panair.out as a sequence of blocks, each
+starting with a line holding a flag of the form 0*b*<name>, and reports
+errors to panair.err, whose last line is ABORT when the run failed. An
+OutputMonitor reads what has been added to both files since it last looked
+while Panair is running. It reports the start of each block as a
+ProgressEvent and raises as soon as a line matching one of its abort
+patterns appears, so that a failed run can be killed right away instead of
+being waited for.
+
+Example
+-------
+def show(event):
+    print(event.stage, event.elapsed)
+
+results = case.run(progress=show,
+                   abort_patterns=["ABORT", "singular matrix"])
+
+Nothing is monitored unless a progress callback or abort patterns are
+given, in which case the wait for Panair polls its process and output
+every few milliseconds instead of blocking.
+
+"""
+from collections import namedtuple
+import os
+import re
+import time
+
+
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "elapsed"])
+ProgressEvent.__doc__ = """Stage reached by a running Panair process.
+
+Attributes
+----------
+stage : str
+    Name of the panair.out block Panair started writing, e.g. 'off-body'.
+elapsed : float
+    Seconds since the monitor was started.
+
+"""
+
+# lines of panair.err reporting a failed run, used when only a progress
+# callback is given
+DEFAULT_ABORT_PATTERNS = (r"^\s*ABORT\b",)
+
+_STAGE = re.compile(rb"0\*b\*(\S+)")
+
+
+class OutputMonitor:
+    """Follows panair.out and panair.err of a running Panair process.
+
+    Parameters
+    ----------
+    directory : str
+        Folder Panair is run in.
+    progress : callable, optional
+        Called with a ProgressEvent whenever Panair starts a new block of
+        panair.out.
+    abort_patterns : list of str, optional
+        Regular expressions searched for in each new line of panair.out and
+        panair.err. Defaults to DEFAULT_ABORT_PATTERNS, which matches the
+        ABORT line Panair writes to panair.err when a run fails.
+
+    """
+    FILES = ("panair.out", "panair.err")
+
+    def __init__(self, directory, progress=None, abort_patterns=None):
+        if abort_patterns is None:
+            abort_patterns = DEFAULT_ABORT_PATTERNS
+        self._directory = directory
+        self._progress = progress
+        # all patterns are searched for in one pass over the new output
+        self._abort = None
+        if len(abort_patterns) > 0:
+            self._abort = re.compile("|".join("(?:"+p+")"
+                                              for p in abort_patterns),
+                                     re.MULTILINE)
+        self._start = time.perf_counter()
+        # files left by an earlier run in the folder are skipped until
+        # Panair writes to them
+        self._stale = {name: self._stamp(name) for name in self.FILES}
+        self._offsets = dict.fromkeys(self.FILES, 0)
+        self._partial = dict.fromkeys(self.FILES, b"")
+        self.stage = None
+
+    def _stamp(self, name):
+        try:
+            stat = os.stat(os.path.join(self._directory, name))
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def poll(self, final=False):
+        """Reads the output added since the last call.
+
+        Parameters
+        ----------
+        final : bool
+            Whether Panair has exited, in which case an unterminated last
+            line of the files is read as well.
+
+        Raises
+        ------
+        RuntimeError
+            If a new line matches one of the abort patterns.
+
+        """
+        for name in self.FILES:
+            data = self._new_data(name, final)
+            if not data:
+                continue
+            if name == "panair.out" and self._progress is not None:
+                for match in _STAGE.finditer(data):
+                    self.stage = match.group(1).decode('latin-1')
+                    self._progress(ProgressEvent(
+                        self.stage, time.perf_counter()-self._start))
+            if self._abort is not None:
+                text = data.decode('latin-1')
+                match = self._abort.search(text)
+                if match is not None:
+                    start = text.rfind("\n", 0, match.start())+1
+                    end = text.find("\n", match.start())
+                    line = text[start:end if end >= 0 else None]
+                    raise RuntimeError("panair run aborted: "+line.strip())
+
+    def _new_data(self, name, final=False):
+        # returns the complete lines added to the file since the last call,
+        # or all of its new data once Panair has exited
+        stamp = self._stamp(name)
+        if stamp is None or stamp == self._stale[name]:
+            return b""
+        self._stale[name] = None
+
+        with open(os.path.join(self._directory, name), 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self._offsets[name]:
+                # the file was rewritten
+                self._offsets[name] = 0
+                self._partial[name] = b""
+            f.seek(self._offsets[name])
+            data = f.read()
+        self._offsets[name] += len(data)
+
+        data = self._partial[name]+data
+        end = len(data) if final else data.rfind(b"\n")+1
+        self._partial[name] = data[end:]
+
+        return data[:end]
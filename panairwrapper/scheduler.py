@@ -0,0 +1,355 @@
+"""This module provides cost-aware scheduling of batches of Panair runs.
+
+The time Panair takes to solve a case grows roughly with the square to cube
+of the number of panels, and evaluating off-body points adds to it. When
+runs of very different sizes are handed to a process pool in the order
+they were given, a large run started last keeps the batch going long after
+the other workers have gone idle. run_batch instead starts the runs
+predicted to take longest first and keeps the predicted memory use of the
+runs in progress within a budget.
+
+The predictions are made by a CostModel from the size of each case. The
+model can be refined with the RunRecords of finished runs, which run_batch
+does with the runs it has completed.
+
+Example
+-------
+from panairwrapper.scheduler import CostModel, run_batch
+
+model = CostModel()
+results = run_batch([small_case, large_case, medium_case], workers=4,
+                    memory_budget=8*2**30, cost_model=model)
+
+"""
+from panairwrapper.sharedgeometry import SharedGeometry
+import os
+import sys
+import numpy as np
+
+
+class CostModel:
+    """Predicts the run time and memory use of Panair runs.
+
+    The run time is modeled as a linear combination of terms in the number
+    of panels P, the number of off-body points O and the number of cases N:
+    1, P^2, P^3, N*P^2 and N*O*P. The peak memory is modeled as linear in P.
+    Until enough runs have been observed, default coefficients are used,
+    scaled to match the observed runs.
+
+    Parameters
+    ----------
+    records : list of RunRecord or dict, optional
+        Records of finished runs to refine the model with, see observe.
+
+    """
+    # default coefficients of the run time terms in seconds and of the
+    # memory terms in bytes
+    DEFAULT_TIME = np.array([0.05, 1e-8, 1e-10, 1e-8, 1e-8])
+    DEFAULT_MEMORY = np.array([50e6, 2e4])
+
+    def __init__(self, records=None):
+        self._time_coefficients = self.DEFAULT_TIME.copy()
+        self._memory_coefficients = self.DEFAULT_MEMORY.copy()
+        self._observations = []
+        if records is not None:
+            for record in records:
+                self.observe(record, refit=False)
+            self.fit()
+
+    @staticmethod
+    def case_size(case):
+        """Returns the number of panels, off-body points and cases of case."""
+        n_panels = 0
+        for name, data, network_type in case._networks:
+            nn, nm = data.shape[:2]
+            n_panels += (nn-1)*(nm-1)
+        n_offbody = 0
+        if case._offbody_points is not None:
+            n_offbody = len(case._offbody_points)
+        n_cases = 1
+        if case._aero_state is not None:
+            n_cases = len(case._case_angles()[0])
+
+        return n_panels, n_offbody, n_cases
+
+    @staticmethod
+    def _time_terms(n_panels, n_offbody, n_cases):
+        P = float(n_panels)
+        return np.array([1., P**2, P**3, n_cases*P**2,
+                         n_cases*n_offbody*P])
+
+    @staticmethod
+    def _memory_terms(n_panels):
+        return np.array([1., float(n_panels)])
+
+    def predict(self, case):
+        """Returns the predicted run time in seconds and memory in bytes."""
+        n_panels, n_offbody, n_cases = self.case_size(case)
+        run_time = self._time_terms(n_panels, n_offbody, n_cases)
+        memory = self._memory_terms(n_panels)
+
+        return (float(run_time.dot(self._time_coefficients)),
+                float(memory.dot(self._memory_coefficients)))
+
+    def observe(self, record, refit=True):
+        """Adds the record of a finished run to the model.
+
+        Records of cached or unsuccessful runs are ignored.
+
+        Parameters
+        ----------
+        record : RunRecord or dict
+            Record of the run as kept in Results.run_record, or its as_dict
+            form as found in the rows returned by sweep.
+        refit : bool
+            Whether to refit the model right away.
+
+        """
+        if not isinstance(record, dict):
+            record = record.as_dict()
+        if (record['cached'] or not record['success'] or
+                'panair' not in record['phases']):
+            return
+
+        max_rss = record['max_rss']
+        if max_rss is not None and sys.platform != 'darwin':
+            # reported in kilobytes everywhere except macOS
+            max_rss *= 1024
+        self._observations.append((record['n_panels'],
+                                   record['n_offbody_points'],
+                                   record['n_cases'],
+                                   record['phases']['panair'], max_rss))
+        if refit:
+            self.fit()
+
+    def fit(self):
+        """Fits the model coefficients to the observed runs."""
+        if not self._observations:
+            return
+
+        terms = np.array([self._time_terms(*o[:3])
+                          for o in self._observations])
+        times = np.array([o[3] for o in self._observations])
+        self._time_coefficients = _fit(terms, times, self.DEFAULT_TIME)
+
+        observed = [o for o in self._observations if o[4] is not None]
+        if observed:
+            terms = np.array([self._memory_terms(o[0]) for o in observed])
+            memory = np.array([o[4] for o in observed], dtype=float)
+            self._memory_coefficients = _fit(terms, memory,
+                                             self.DEFAULT_MEMORY)
+
+
+def _fit(terms, values, default):
+    # least squares fit of non-negative coefficients. With too few
+    # observations to determine all of them, the default coefficients are
+    # scaled to fit instead.
+    scale = np.abs(terms).max(axis=0)
+    scale[scale == 0.] = 1.
+    if len(values) >= 2*len(default):
+        coefficients = np.linalg.lstsq(terms/scale, values, rcond=None)[0]
+        coefficients = np.clip(coefficients, 0., None)/scale
+        if np.any(coefficients > 0.):
+            return coefficients
+
+    prediction = terms.dot(default)
+    factor = prediction.dot(values)/max(prediction.dot(prediction), 1e-300)
+
+    return default*max(factor, 1e-12)
+
+
+def schedule(costs, memory, workers, memory_budget=None):
+    """Returns the order runs are started in by run_batch.
+
+    This simulates run_batch with the predicted run times, which is useful
+    for checking a schedule before running it.
+
+    Parameters
+    ----------
+    costs, memory : list of float
+        Predicted run time and memory of each run.
+    workers : int
+        Number of runs done at once.
+    memory_budget : float, optional
+        Maximum total predicted memory of the runs in progress.
+
+    Returns
+    -------
+    list of (int, float)
+        Index and predicted start time of each run, in the order started.
+
+    """
+    pending = _by_cost(costs)
+    running = []
+    started = []
+    now = 0.
+    while pending:
+        index = _next_run(pending, running, memory, workers, memory_budget)
+        if index is None:
+            # wait for the run finishing first
+            running.sort()
+            now = running.pop(0)[0]
+            continue
+        pending.remove(index)
+        running.append((now+costs[index], index))
+        started.append((index, now))
+
+    return started
+
+
+def run_batch(cases, workers=None, memory_budget=None, cost_model=None,
+              cache=None, initializer=None, initargs=(), share_geometry=True,
+              abort_patterns=None, workspaces=None):
+    """Runs a batch of cases in a process pool, longest predicted first.
+
+    Parameters
+    ----------
+    cases : list of PanairWrapper
+        Cases to run. Each must have its own directory.
+    workers : int
+        Maximum number of Panair instances running at once. Defaults to
+        the number of processors on the machine.
+    memory_budget : float, optional
+        Maximum total predicted memory in bytes of the runs in progress. A
+        run that doesn't fit waits for others to finish, unless nothing else
+        is running.
+    cost_model : CostModel, optional
+        Model predicting the run time and memory of each case. It is
+        refined with the records of the finished runs. Defaults to a new
+        CostModel.
+    cache : ResultCache, optional
+        Cache passed on to the run of each case (see PanairWrapper.run).
+    initializer, initargs : optional
+        Passed on to the ProcessPoolExecutor.
+    share_geometry : bool
+        If True, the geometry of the cases is handed to the workers through
+        a SharedGeometry, once for all cases sharing the same networks and
+        off-body points, instead of being pickled for every run.
+    abort_patterns : list of str, optional
+        Passed on to the run of each case (see PanairWrapper.run).
+    workspaces : list of str, optional
+        Folders to run the cases in instead of their own directories, see
+        workspace.WorkspacePool. Each run in progress is given one of them,
+        so no more runs than workspaces are done at once.
+
+    Returns
+    -------
+    list of list of dict
+        For each case, in the order given, the rows of its cases as
+        described in PanairWrapper.sweep.
+
+    """
+    # imported here to keep importing this module cheap
+    from concurrent.futures import (ProcessPoolExecutor, wait,
+                                    FIRST_COMPLETED)
+    from concurrent.futures.process import BrokenProcessPool
+    from panairwrapper.panairwrapper import _run_sweep_case, _sweep_rows
+
+    if cost_model is None:
+        cost_model = CostModel()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    free_workspaces = None
+    if workspaces is not None:
+        if not workspaces:
+            raise RuntimeError("no workspaces given")
+        free_workspaces = list(workspaces)
+        workers = min(workers, len(workspaces))
+
+    predictions = [cost_model.predict(case) for case in cases]
+    costs = [p[0] for p in predictions]
+    memory = [p[1] for p in predictions]
+
+    # cases copied from the same case share their geometry objects
+    payloads = list(cases)
+    geometries = {}
+    if share_geometry:
+        for i, case in enumerate(cases):
+            key = (id(case._networks), id(case._offbody_points))
+            if key not in geometries:
+                geometries[key] = SharedGeometry(case)
+            payloads[i] = geometries[key].strip(case)
+
+    pending = _by_cost(costs)
+    running = {}
+    workspace_of = {}
+    results = [None]*len(cases)
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=workers,
+                                   initializer=initializer,
+                                   initargs=initargs)
+
+    executor = new_executor()
+    try:
+        while pending or running:
+            index = _next_run(pending, list(running.values()), memory,
+                              workers, memory_budget)
+            if index is not None:
+                pending.remove(index)
+                workspace = None
+                if free_workspaces is not None:
+                    workspace = free_workspaces.pop()
+                args = (_run_sweep_case, payloads[index], cache,
+                        abort_patterns, workspace)
+                try:
+                    future = executor.submit(*args)
+                except BrokenProcessPool:
+                    # a worker process died, the remaining runs are done
+                    # in a new pool
+                    executor.shutdown(wait=False)
+                    executor = new_executor()
+                    future = executor.submit(*args)
+                running[future] = (costs[index], index)
+                workspace_of[future] = workspace
+                continue
+
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)[1]
+                if free_workspaces is not None:
+                    free_workspaces.append(workspace_of[future])
+                del workspace_of[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    # e.g. the worker process died, only this run fails
+                    rows = _sweep_rows(cases[index], error="{0}: {1}".format(
+                        type(e).__name__, e))
+                results[index] = rows
+                # all rows of a run share its record
+                if rows and rows[0]['run_record'] is not None:
+                    cost_model.observe(rows[0]['run_record'])
+
+            # reorder the remaining runs with the refined model
+            for index in pending:
+                costs[index], memory[index] = cost_model.predict(
+                    cases[index])
+            pending.sort(key=lambda i: -costs[i])
+    finally:
+        executor.shutdown()
+        for geometry in geometries.values():
+            geometry.close()
+
+    return results
+
+
+def _by_cost(costs):
+    # indices of the runs ordered by decreasing cost
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def _next_run(pending, running, memory, workers, memory_budget):
+    # returns the costliest pending run that can be started now, or None.
+    # running holds a (cost, index) tuple per run in progress.
+    if not pending or len(running) >= workers:
+        return None
+    if memory_budget is None or not running:
+        return pending[0]
+
+    used = sum(memory[i] for c, i in running)
+    for index in pending:
+        if used+memory[index] <= memory_budget:
+            return index
+
+    return None
@@ -0,0 +1,176 @@
+"""This module provides sharing of case geometry with worker processes.
+
+Running many flow conditions of one geometry in a process pool would
+otherwise pickle every network array and the off-body points for every
+run. A SharedGeometry writes the arrays once to a memory-mapped .npy file,
+by default on the /dev/shm tmpfs where available. The cases sent to the
+workers are stripped of their arrays and only carry a small manifest
+describing where each array is found in the file. Each worker maps the
+file once and builds its networks as read-only views into it, so the pages
+are shared between all processes instead of being copied.
+
+Example
+-------
+from panairwrapper.sharedgeometry import SharedGeometry
+
+with SharedGeometry(case) as geometry:
+    light_case = geometry.strip(case)
+    # send light_case to a worker process, which calls
+    # restore(light_case) to get a runnable case back
+
+"""
+from collections import OrderedDict
+import copy
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+# memory maps of the geometries used by this process, keyed by file path
+# and ordered from least to most recently used
+_mapped = OrderedDict()
+# maximum number of geometries kept mapped by a process
+_MAX_MAPPED = 8
+
+
+class SharedGeometry:
+    """Networks and off-body points of a case placed in a memory-mapped file.
+
+    Parameters
+    ----------
+    case : PanairWrapper
+        Case whose geometry is shared.
+    directory : str, optional
+        Folder the file is written in. If None, a temporary folder is
+        created in /dev/shm when available and removed again by close.
+
+    """
+    def __init__(self, case, directory=None):
+        self._owns_directory = directory is None
+        if directory is None:
+            shm = "/dev/shm"
+            directory = tempfile.mkdtemp(
+                prefix="panair_geometry_",
+                dir=shm if os.path.isdir(shm) else None)
+        self._directory = directory
+
+        arrays = []
+        networks = []
+        offset = 0
+        for name, data, network_type in case._networks:
+            data = np.asarray(data, dtype=float)
+            networks.append((name, network_type, data.shape, offset))
+            arrays.append(data)
+            offset += data.size//3
+
+        offbody = None
+        offbody_sets = []
+        if case._offbody_points is not None:
+            data = np.asarray(case._offbody_points, dtype=float)
+            offbody = (data.shape, offset)
+            arrays.append(data)
+            start = 0
+            for name, points in case._offbody_sets.items():
+                offbody_sets.append((name, start, start+len(points)))
+                start += len(points)
+            offset += data.size//3
+
+        fd, path = tempfile.mkstemp(suffix=".npy", dir=directory)
+        os.close(fd)
+        points = np.lib.format.open_memmap(path, mode='w+', dtype=float,
+                                           shape=(offset, 3))
+        start = 0
+        for data in arrays:
+            points[start:start+data.size//3] = data.reshape(-1, 3)
+            start += data.size//3
+        points.flush()
+        del points
+
+        self.manifest = {'path': path, 'networks': networks,
+                         'offbody': offbody, 'offbody_sets': offbody_sets}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def strip(self, case):
+        """Returns a copy of case referencing the shared geometry.
+
+        The copy holds none of the network and off-body arrays and none of
+        the formatted text of the case, so it is cheap to pickle. Use
+        restore to turn it back into a runnable case.
+
+        """
+        stripped = copy.copy(case)
+        stripped._networks = None
+        stripped._offbody_points = None
+        stripped._offbody_sets = OrderedDict()
+        stripped._render_cache = {}
+        stripped._shared_geometry = self.manifest
+
+        return stripped
+
+    def close(self):
+        """Removes the file, or its folder if it was created temporarily."""
+        path = self.manifest['path']
+        _mapped.pop(path, None)
+        if self._owns_directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def restore(case):
+    """Returns a runnable copy of a case stripped by SharedGeometry.strip.
+
+    The networks and off-body points of the copy are read-only views into
+    the shared file. Cases that weren't stripped are returned as is.
+
+    """
+    # imported here as panairwrapper.panairwrapper imports this module
+    from panairwrapper.panairwrapper import NetworkRegistry
+
+    manifest = getattr(case, "_shared_geometry", None)
+    if manifest is None:
+        return case
+
+    points = _map(manifest['path'])
+    restored = copy.copy(case)
+    restored._networks = NetworkRegistry()
+    for name, network_type, shape, offset in manifest['networks']:
+        size = int(np.prod(shape[:-1]))
+        data = points[offset:offset+size].reshape(shape)
+        restored._networks.add(name, data, network_type)
+
+    if manifest['offbody'] is not None:
+        shape, offset = manifest['offbody']
+        offbody = points[offset:offset+shape[0]]
+        restored._offbody_points = offbody
+        restored._offbody_sets = OrderedDict(
+            (name, offbody[start:stop])
+            for name, start, stop in manifest['offbody_sets'])
+    restored._render_cache = {}
+    restored._shared_geometry = None
+
+    return restored
+
+
+def _map(path):
+    # returns the memory map of a geometry file, mapping it if needed. Maps
+    # of files removed by SharedGeometry.close in another process and the
+    # least recently used maps beyond _MAX_MAPPED are dropped, so that a
+    # long-lived worker doesn't keep every file it has seen open.
+    for other in [p for p in _mapped if p != path and not os.path.exists(p)]:
+        del _mapped[other]
+
+    points = _mapped.pop(path, None)
+    if points is None:
+        points = np.load(path, mmap_mode='r')
+    _mapped[path] = points
+    while len(_mapped) > _MAX_MAPPED:
+        _mapped.popitem(last=False)
+
+    return points
@@ -0,0 +1,154 @@
+"""This module provides reusable scratch directories for running Panair.
+
+Each Panair run needs a folder holding the inputfile, the scratch files
+Panair creates while solving and its output files. Creating such a folder
+and placing the executable in it for every run adds up when running
+thousands of short cases. A WorkspacePool creates a fixed number of
+folders once and hands them out to runs, resetting them in between.
+
+Example
+-------
+from panairwrapper.workspace import WorkspacePool
+
+with WorkspacePool(4, "./panair", tmpfs=True) as pool:
+    rows = case.sweep(alpha=[0., 1., 2., 3.], workspace_pool=pool)
+
+"""
+import os
+import queue
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+class WorkspacePool:
+    """A fixed set of scratch directories that runs are done in.
+
+    Parameters
+    ----------
+    size : int
+        Number of workspaces.
+    exe : str
+        Path to the Panair executable. It is linked into every workspace.
+    root : str, optional
+        Folder the workspaces are created in. If None, a temporary folder is
+        created and removed again by close.
+    tmpfs : bool
+        If True and root is None, the temporary folder is created in
+        /dev/shm when available, so scratch files are kept in memory.
+
+    """
+    def __init__(self, size, exe, root=None, tmpfs=False):
+        self._owns_root = root is None
+        if root is None:
+            shm = "/dev/shm"
+            tmp_dir = shm if tmpfs and os.path.isdir(shm) else None
+            root = tempfile.mkdtemp(prefix="panair_", dir=tmp_dir)
+
+        self._root = root
+        self._exe = exe
+        self._free = queue.Queue()
+        self._workspaces = []
+        for i in range(size):
+            path = os.path.join(root, "workspace_{0:03d}".format(i))
+            if not os.path.exists(path):
+                os.makedirs(path)
+            link_executable(exe, path)
+            self._workspaces.append(path)
+            self._free.put(path)
+
+    def __len__(self):
+        return len(self._workspaces)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def acquire(self, timeout=None):
+        """Returns the path of a free workspace, waiting for one if needed."""
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError("no workspace available")
+
+    def release(self, path):
+        """Resets a workspace and returns it to the pool."""
+        reset_workspace(path, keep=[os.path.basename(self._exe)])
+        self._free.put(path)
+
+    @contextmanager
+    def workspace(self, timeout=None):
+        """Context manager that acquires a workspace and releases it after."""
+        path = self.acquire(timeout)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def close(self):
+        """Removes the workspaces if they were created in a temporary folder."""
+        if self._owns_root and os.path.exists(self._root):
+            shutil.rmtree(self._root)
+
+
+def link_executable(exe, directory):
+    """Places the executable in directory unless it is already there.
+
+    A hard link is used where possible, falling back to a symbolic link and
+    finally to a copy of the executable.
+
+    """
+    if not os.path.isfile(exe):
+        raise FileNotFoundError("Panair executable not found: "+exe)
+
+    target = os.path.join(directory, os.path.basename(exe))
+    if os.path.lexists(target):
+        if _same_file(exe, target):
+            return target
+        os.remove(target)
+
+    try:
+        os.link(exe, target)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(exe), target)
+        except OSError:
+            shutil.copy2(exe, target)
+
+    return target
+
+
+def _same_file(exe, target):
+    # checks whether target is, links to, or is an unchanged copy of exe
+    try:
+        if os.path.samefile(exe, target):
+            return True
+        exe_stat = os.stat(exe)
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+
+    return (exe_stat.st_size == target_stat.st_size and
+            exe_stat.st_mtime_ns == target_stat.st_mtime_ns)
+
+
+def reset_workspace(directory, prefix='', keep=()):
+    """Removes the files in directory starting with prefix.
+
+    Parameters
+    ----------
+    directory : str
+        Folder to clean.
+    prefix : str
+        Only files whose names start with prefix are removed. By default all
+        files are removed.
+    keep : list of str
+        Names of files that are never removed.
+
+    """
+    for entry in os.scandir(directory):
+        if (entry.name.startswith(prefix) and entry.name not in keep and
+                not entry.is_dir(follow_symlinks=False)):
+            os.remove(entry.path)
@@ -10,5 +10,7 @@ setup(name='panairwrapper',
       author_email='doug.hunsaker@usu.edu',
       license='MIT',
       packages=['panairwrapper'],
-      install_requires=['numpy', 'scipy', 'PyQt5', 'pyqtgraph', 'PyOpenGL'],
+      install_requires=['numpy'],
+      extras_require={'plot': ['PyQt5', 'pyqtgraph', 'PyOpenGL'],
+                      'vtk': ['pyevtk']},
       zip_safe=False)
@@ -0,0 +1,160 @@
+"""Stand-in for the Panair executable used by the tests and benchmarks.
+
+Like Panair, it reads the name of the inputfile from stdin, reads the
+networks, off-body points and angles of attack from it and writes panair.out,
+ffmf, agps and panair.err in the current directory. The files have the
+layout and roughly the size of the real ones, but the values are made up:
+the pressure coefficient of every point and the lift coefficient are
+0.01 and 0.1 times the angle of attack of each case.
+
+The following environment variables change its behavior.
+
+STUB_PANAIR_DELAY
+    Seconds to sleep after writing the geometry block of panair.out and
+    before writing the rest of the output files.
+STUB_PANAIR_ABORT
+    If set, panair.err reports an aborted run, before the delay.
+
+"""
+import os
+import stat
+import sys
+import time
+
+
+def write_executable(directory, name="panair"):
+    """Writes a shell script running this stub and returns its path."""
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write("#!/bin/sh\nexec '{0}' '{1}' \"$@\"\n".format(
+            sys.executable, os.path.abspath(__file__)))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    return path
+
+
+def _read_blocks(filename):
+    # returns the title and lines of each input block
+    blocks = []
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('$'):
+                blocks.append((line[1:].strip(), []))
+            elif blocks:
+                blocks[-1][1].append(line.rstrip('\n'))
+
+    return blocks
+
+
+def _fields(line):
+    # values of the 10 character wide fields of an input line
+    return [float(line[i:i+10]) for i in range(0, len(line.rstrip()), 10)]
+
+
+def _read_inputfile(filename):
+    networks = []
+    offbody = []
+    alphas = [0.]
+    for title, lines in _read_blocks(filename):
+        if title.startswith('POINTS'):
+            i = 4
+            while i < len(lines):
+                name = lines[i].split()[-1]
+                nm, nn = [int(v) for v in _fields(lines[i+1])[:2]]
+                n_lines = (nm+1)//2*nn
+                coords = []
+                for line in lines[i+2:i+2+n_lines]:
+                    coords.extend(_fields(line))
+                points = [coords[k:k+3] for k in range(0, len(coords), 3)]
+                networks.append((name, nn, nm, points))
+                i += 2+n_lines
+        elif title.startswith('XYZ OF OFF-BODY'):
+            coords = []
+            for line in lines[3:]:
+                coords.extend(_fields(line))
+            offbody = [coords[k:k+3] for k in range(0, len(coords), 3)]
+        elif title.startswith('ANGLES OF ATTACK'):
+            # the angles are given 6 per card, each after a header line
+            alphas = []
+            for line in lines[3::2]:
+                alphas.extend(_fields(line))
+
+    return networks, offbody, alphas
+
+
+def _write_geometry(f, networks):
+    f.write("1 stub panair\n")
+    f.write("0*b*geometry\n")
+    for name, nn, nm, points in networks:
+        f.write(" network "+name+"\n")
+        for i, p in enumerate(points):
+            f.write(" %6d%14.6f%14.6f%14.6f\n" % (i+1, p[0], p[1], p[2]))
+    f.write("0*e*geometry\n")
+
+
+def _write_offbody(f, offbody, alphas):
+    for k, alpha in enumerate(alphas):
+        f.write("0*b*off-body\n")
+        f.write("header\n"*6)
+        for i, p in enumerate(offbody):
+            f.write(" %4d%5d    %11.4f%11.4f%11.4f    %11.4f%11.4f%11.4f"
+                    "  %11.4f  %11.4f%11.4f\n"
+                    % (i+1, k+1, p[0], p[1], p[2], 0., 0., 0.,
+                       0.01*alpha, 0., 0.))
+        f.write("0*e*off-body\n")
+
+
+def _write_ffmf(alphas):
+    with open('ffmf', 'w') as f:
+        f.write("header\n"*17)
+        for k, alpha in enumerate(alphas):
+            f.write(" %6d %8.4f %8.4f %10.6f %10.6f %10.6f %10.6f %10.6f"
+                    " %10.6f\n" % (k+1, alpha, 0., 0.1*alpha, 0.01, 0., 1., 0.,
+                                   0.1*alpha))
+            f.write(" %10.6f %10.6f %10.6f %10.6f\n"
+                    % (0., 0.02*alpha, 0., 1.))
+
+
+def _write_agps(networks, alphas):
+    with open('agps', 'w') as f:
+        f.write("header\n"*6)
+        cps = "".join("%13.6f" % (0.01*alpha) for alpha in alphas)
+        for n, (name, nn, nm, points) in enumerate(networks):
+            for c in range(nn):
+                f.write("n%dc%d\n" % (n+1, c+1))
+                f.write(" irow  x  y  z" +
+                        "".join("  cp%d" % (k+1) for k in range(len(alphas))) +
+                        "\n")
+                for r in range(nm):
+                    p = points[c*nm+r]
+                    f.write("%5d%13.6f%13.6f%13.6f" % (r+1, p[0], p[1], p[2]) +
+                            cps+"\n")
+        f.write("*eof\n")
+
+
+def main():
+    filename = sys.stdin.readline().strip()
+    networks, offbody, alphas = _read_inputfile(filename)
+    abort = os.environ.get('STUB_PANAIR_ABORT')
+
+    with open('panair.err', 'w') as err, open('panair.out', 'w') as out:
+        err.write("stub panair\n")
+        if abort:
+            err.write("ABORT\n")
+        _write_geometry(out, networks)
+        err.flush()
+        out.flush()
+
+        delay = float(os.environ.get('STUB_PANAIR_DELAY', '0'))
+        if delay:
+            time.sleep(delay)
+
+        _write_offbody(out, offbody, alphas)
+        _write_ffmf(alphas)
+        _write_agps(networks, alphas)
+        if not abort:
+            err.write("END\n")
+
+
+if __name__ == "__main__":
+    main()
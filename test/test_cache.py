@@ -0,0 +1,78 @@
+"""Tests the result cache."""
+import os
+import numpy as np
+import pytest
+import panairwrapper.filehandling as fh
+from panairwrapper.cache import ResultCache
+
+
+def _write_outputfiles(directory):
+    with open(str(directory.join("ffmf")), 'w') as f:
+        f.writelines(["ffmf header\n"]*17)
+        f.write("  1  2.0  0.0  0.20  0.01  0.0  1.0  0.0  0.20\n")
+        f.write("  0.0  0.04  0.0  1.0\n")
+    with open(str(directory.join("panair.out")), 'w') as f:
+        f.write("0*b*off-body\n")
+        f.writelines(["header\n"]*6)
+        f.write(" 1 1 0.5 0.0 -1.0\n 2 1 1.0 0.0 -1.0\n")
+        f.write("0*e*off-body\n")
+
+
+def test_cache_roundtrip(tmpdir):
+    _write_outputfiles(tmpdir)
+    inputfile = tmpdir.join("case.INP")
+    inputfile.write("$TITLE\ncase\n$end")
+    exe = tmpdir.join("panair")
+    exe.write("")
+
+    cache = ResultCache(str(tmpdir.join("cache")))
+    key = cache.key(str(inputfile), str(exe))
+    assert cache.get(key) is None
+
+    output_file = fh.OutputFiles(str(tmpdir))
+    cache.put(key, output_file)
+
+    cached = cache.get(key)
+    assert cached.get_forces_and_moments() == output_file.get_forces_and_moments()
+    assert np.array_equal(cached.get_offbody_data(),
+                          output_file.get_offbody_data())
+
+    # a different inputfile gives a different key
+    inputfile.write("$TITLE\nother case\n$end")
+    assert cache.key(str(inputfile), str(exe)) != key
+
+
+def test_cache_eviction(tmpdir):
+    _write_outputfiles(tmpdir)
+    output_file = fh.OutputFiles(str(tmpdir))
+
+    cache = ResultCache(str(tmpdir.join("cache")))
+    cache.put("first", output_file)
+    entry_size = os.path.getsize(str(tmpdir.join("cache", "first.npz")))
+
+    # room for two entries, the least recently used is evicted
+    cache = ResultCache(str(tmpdir.join("cache")), max_size=2*entry_size)
+    cache.put("second", output_file)
+    os.utime(str(tmpdir.join("cache", "first.npz")), (0, 0))
+    os.utime(str(tmpdir.join("cache", "second.npz")), (1, 1))
+    assert cache.get("first") is not None
+    cache.put("third", output_file)
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+
+def test_cache_put_error(tmpdir, monkeypatch):
+    _write_outputfiles(tmpdir)
+    output_file = fh.OutputFiles(str(tmpdir))
+    cache = ResultCache(str(tmpdir.join("cache")))
+
+    def savez(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    # a failed write leaves no partial entry behind
+    monkeypatch.setattr(np, "savez", savez)
+    with pytest.raises(OSError):
+        cache.put("entry", output_file)
+    assert os.listdir(str(tmpdir.join("cache"))) == []
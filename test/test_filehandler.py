@@ -10,9 +10,7 @@ import panairwrapper.filehandling as fh
 TESTFILE_DIR = "./test/testfiles/"
 
 
-def test_inputfile():
-
-    inputfile = fh.InputFile()
+def _build_inputfile(inputfile):
 
     inputfile.title("test case", "Ted Giblette")
     inputfile.datacheck(0)
@@ -34,9 +32,223 @@ def test_inputfile():
     xyz_offbody_points = np.zeros((10, 3))
     inputfile.xyzcoordinatesofoffbodypoints(10, xyz_offbody_points)
 
+
+def test_inputfile():
+
+    inputfile = fh.InputFile()
+    _build_inputfile(inputfile)
+
     newfilename = TESTFILE_DIR+"test_input.INP"
     reffilename = TESTFILE_DIR+"inputfile.REF"
 
     inputfile.write_inputfile(newfilename)
 
     assert filecmp.cmp(newfilename, reffilename)
+
+
+def test_anglesofattack_cards():
+    inputfile = fh.InputFile()
+    alphas = [float(i) for i in range(8)]
+    inputfile.anglesofattack(0., alphas)
+    inputfile.yawangle(0., [0.]*8)
+
+    # more than 6 angles are continued on a second card
+    lines = inputfile._input_dict["ANGLES OF ATTACK"].splitlines()
+    assert len(lines) == 6
+    assert max(len(line) for line in lines) <= 60
+    assert lines[2].startswith("=alpha(0)")
+    assert lines[4].startswith("=alpha(6)")
+    values = [float(line[i:i+10]) for line in lines[3::2]
+              for i in range(0, len(line), 10)]
+    assert values == alphas
+    assert len(inputfile._input_dict["YAW ANGLE"].splitlines()) == 6
+
+
+def test_inputfile_streaming():
+
+    inputfile = fh.InputFile(streaming=True, chunk_size=4)
+    _build_inputfile(inputfile)
+
+    newfilename = TESTFILE_DIR+"test_input_streaming.INP"
+    reffilename = TESTFILE_DIR+"inputfile.REF"
+
+    inputfile.write_inputfile(newfilename)
+
+    assert filecmp.cmp(newfilename, reffilename, shallow=False)
+
+
+def test_format_coords():
+    inputfile = fh.InputFile()
+    points = np.array([[[1.5, -12.25, 123.], [-1234.5, 12345., 0.]],
+                       [[-0., 99999., -5.], [0.1, 0.2, 0.3]]])
+
+    text = inputfile._format_coords(points)
+    test_text = ("1.50000000-12.250000123.000000-1234.500012345.00000.00000000\n"
+                 "-0.000000099999.0000-5.00000000.100000000.200000000.30000000\n")
+    assert text == test_text
+
+    # rows with an odd number of points end with a single point line
+    text = inputfile._format_coords(points[:, :1])
+    test_text = ("1.50000000-12.250000123.000000\n"
+                 "-0.000000099999.0000-5.0000000\n")
+    assert text == test_text
+
+
+def test_format_coords_out_of_range():
+    inputfile = fh.InputFile()
+    points = np.array([[[0., 100000., 0.]]])
+
+    with pytest.raises(RuntimeError):
+        inputfile._format_coords(points)
+
+
+def _write_outfile(directory, n_points):
+    lines = ["1panair output\n", "0*b*geometry\n", " 1.0 2.0\n",
+             "0*e*geometry\n"]
+    for case in range(2):
+        lines.append("0*b*off-body  data\n")
+        lines.extend(["header\n"]*6)
+        for i in range(n_points):
+            lines.append(" {0} {1} {2}\n".format(i+1, case+1, 0.5*i))
+        lines.append("0*e*off-body\n")
+    with open(str(directory.join("panair.out")), 'w') as f:
+        f.writelines(lines)
+
+
+def test_get_block(tmpdir):
+    _write_outfile(tmpdir, 3)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    assert outputfiles._get_block("geometry") == [" 1.0 2.0\n"]
+
+    data = outputfiles.get_offbody_data()
+    test_data = np.array([[1., 1., 0.], [2., 1., 0.5], [3., 1., 1.]])
+    assert np.array_equal(data, test_data)
+
+    second_case = outputfiles._get_block("off-body", occurrence=1)
+    assert second_case[6] == " 1 2 0.0\n"
+    assert outputfiles.get_offbody_data(1)[0, 1] == 2.
+
+    # blocks not matching the layout of a multi-case run are rejected
+    with pytest.raises(RuntimeError):
+        outputfiles.get_offbody_data(2)
+    with open(str(tmpdir.join("panair.out")), 'a') as f:
+        f.writelines(["0*b*off-body\n"]+["header\n"]*6+[" 1 1 0.0\n",
+                                                       "0*e*off-body\n"])
+    with pytest.raises(RuntimeError):
+        outputfiles.get_offbody_data(2)
+
+    with pytest.raises(RuntimeError):
+        outputfiles._get_block("missing")
+
+
+def test_single_case_layout(tmpdir):
+    # single-case output is read without checking the case layout
+    lines = ["0*b*off-body\n"]+["header\n"]*6+[" 1 0 0.5\n", " 2 0 1.0\n",
+                                               "0*e*off-body\n"]
+    with open(str(tmpdir.join("panair.out")), 'w') as f:
+        f.writelines(lines)
+    lines = ["ffmf header\n"]*17
+    lines += ["  0  0.0  0.0  0.10  0.01  0.0  1.0  0.0  0.10  9.0\n",
+              "  0.0  0.02  0.0  1.0\n"]
+    with open(str(tmpdir.join("ffmf")), 'w') as f:
+        f.writelines(lines)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    assert np.array_equal(outputfiles.get_offbody_data()[:, 2], [0.5, 1.])
+    assert outputfiles.get_forces_and_moments()['cl'] == 0.1
+    with pytest.raises(RuntimeError):
+        outputfiles.get_offbody_data(1)
+
+
+def test_get_block_index_invalidated(tmpdir):
+    _write_outfile(tmpdir, 3)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+    assert outputfiles.get_offbody_data().shape == (3, 3)
+
+    # rewriting panair.out changes its size so the index is rebuilt
+    _write_outfile(tmpdir, 5)
+    assert outputfiles.get_offbody_data().shape == (5, 3)
+
+
+def _write_agps(directory):
+    lines = ["agps header\n"]*6
+    lines += ["n1c1\n", " irow  x  y  z  cp1\n",
+              "    1 0.0 0.0 0.0 0.1\n", "    2 0.0 1.0 0.0 0.2\n",
+              "n1c2\n", " irow  x  y  z  cp1\n",
+              "    1 1.0 0.0 0.0 0.3\n", "    2 1.0 1.0 0.0 0.4\n",
+              "n2c1\n", " irow  x  y  z  cp1\n",
+              "    1 2.0 0.0 0.0 0.5\n", "*eof\n"]
+    with open(str(directory.join("agps")), 'w') as f:
+        f.writelines(lines)
+
+
+def test_read_agps(tmpdir):
+    _write_agps(tmpdir)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    data = outputfiles.read_agps()
+    assert data.dtype == fh.AGPS_DTYPE
+    assert np.array_equal(data['network'], [1, 1, 1, 1, 2])
+    assert np.array_equal(data['column'], [1, 1, 2, 2, 1])
+    assert np.array_equal(data['row'], [1, 2, 1, 2, 1])
+    assert np.array_equal(data['cp'], [0.1, 0.2, 0.3, 0.4, 0.5])
+
+    assert outputfiles.parse_agps()[2] == [1, 2, 1, 1., 0., 0., 0.3]
+
+
+def test_get_agps_grids(tmpdir):
+    _write_agps(tmpdir)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    grids = outputfiles.get_agps_grids()
+    assert list(grids.keys()) == [1, 2]
+    assert np.array_equal(grids[1]['x'], [[0., 1.], [0., 1.]])
+    assert np.array_equal(grids[1]['cp'], [[0.1, 0.3], [0.2, 0.4]])
+    assert grids[2]['y'].shape == (1, 1)
+
+
+def test_generate_vtk(tmpdir):
+    pytest.importorskip("pyevtk")
+    _write_agps(tmpdir)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    vtm_file = outputfiles.generate_vtk(directory=str(tmpdir), workers=2)
+
+    with open(vtm_file) as f:
+        vtm = f.read()
+    for n in [1, 2]:
+        vts_file = "panair_network{0}.vts".format(n)
+        assert 'file="'+vts_file+'"' in vtm
+        assert tmpdir.join(vts_file).check()
+
+
+def test_get_forces_and_moments_cases(tmpdir):
+    lines = ["ffmf header\n"]*17
+    lines += ["  1  0.0  0.0  0.10  0.01  0.0  1.0  0.0  0.10\n",
+              "  0.0  0.02  0.0  1.0\n",
+              "\n",
+              "  2  2.0  0.0  0.30  0.02  0.0  1.0  0.0  0.30\n",
+              "  0.0  0.04  0.0  1.0\n"]
+    with open(str(tmpdir.join("ffmf")), 'w') as f:
+        f.writelines(lines)
+    outputfiles = fh.OutputFiles(str(tmpdir))
+
+    ffmf = outputfiles.get_forces_and_moments()
+    assert ffmf['cl'] == 0.1
+    assert ffmf['my'] == 0.02
+
+    ffmf = outputfiles.get_forces_and_moments(case=1)
+    assert ffmf['cl'] == 0.3
+    assert ffmf['cdi'] == 0.02
+    assert ffmf['my'] == 0.04
+
+    with pytest.raises(RuntimeError):
+        outputfiles.get_forces_and_moments(case=2)
+
+    # a pair of lines not starting with the solution number is rejected
+    lines[-2] = "  1"+lines[-2][3:]
+    with open(str(tmpdir.join("ffmf")), 'w') as f:
+        f.writelines(lines)
+    with pytest.raises(RuntimeError):
+        outputfiles.get_forces_and_moments(case=1)
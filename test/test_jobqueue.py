@@ -0,0 +1,142 @@
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import pytest
+
+import panairwrapper
+from panairwrapper.jobqueue import JobQueue, run_worker
+import stub_panair
+
+
+def _case(directory, exe, alpha):
+    case = panairwrapper.PanairWrapper("queued_case", directory, exe=exe)
+    case.set_aero_state(mach=1.6, alpha=alpha)
+    case.add_network("body", np.random.rand(4, 3, 3))
+    case.add_offbody_points(np.random.rand(7, 3), name="line")
+
+    return case
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_jobqueue_workers(tmpdir):
+    exe = stub_panair.write_executable(str(tmpdir))
+    path = str(tmpdir.join("jobs.db"))
+    with JobQueue(path) as queue:
+        job_ids = [queue.submit(_case(str(tmpdir.join("case")), exe, alpha))
+                   for alpha in [0., 1., 2., [3., 4.]]]
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        workers = [subprocess.Popen([sys.executable, "-m",
+                                     "panairwrapper.jobqueue", path,
+                                     "--exe", exe], env=env,
+                                    stdout=subprocess.DEVNULL)
+                   for i in range(3)]
+        for worker in workers:
+            assert worker.wait(timeout=120) == 0
+
+        assert queue.counts()["done"] == 4
+        # every job was run exactly once
+        assert [queue.status(i)[1] for i in job_ids] == [1, 1, 1, 1]
+        assert queue.results(job_ids[2]).get_forces_and_moments()["cl"] == \
+            pytest.approx(0.2)
+        results = queue.results(job_ids[3])
+        assert results.get_forces_and_moments(1)["cl"] == pytest.approx(0.4)
+        assert np.allclose(results.get_offbody_data(1, name="line")[:, 8],
+                           0.04)
+
+        # results of a job have no folder to write files to by default
+        with pytest.raises(RuntimeError):
+            results.write_agps()
+        results.write_agps(directory=str(tmpdir))
+        assert tmpdir.join("agps.csv").check()
+        results = queue.results(job_ids[3], directory=str(tmpdir))
+        results.write_agps(1, filename="agps_1.csv")
+        assert tmpdir.join("agps_1.csv").check()
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_jobqueue_lost_worker(tmpdir):
+    exe = stub_panair.write_executable(str(tmpdir))
+    path = str(tmpdir.join("jobs.db"))
+    with JobQueue(path, lease_time=0.5, max_attempts=2) as queue:
+        job_id = queue.submit(_case(str(tmpdir.join("case")), exe, 1.))
+
+        # a worker claims the job and dies without reporting back
+        assert queue.claim("lost")["id"] == job_id
+        assert queue.claim("other") is None
+        time.sleep(0.6)
+
+        # the lease time of the job applies, not that of the worker's queue
+        assert run_worker(path, exe) == 1
+        assert queue.status(job_id)[:2] == ("done", 2)
+        # the lost worker can't overwrite the result
+        assert not queue.complete(job_id, "lost", {})
+
+
+def test_jobqueue_max_attempts(tmpdir):
+    path = str(tmpdir.join("jobs.db"))
+    with JobQueue(path, max_attempts=2) as queue:
+        job_id = queue.submit(_case(str(tmpdir.join("case")), "panair", 1.))
+
+        for i in range(2):
+            job = queue.claim("worker")
+            assert job["attempts"] == i+1
+            queue.fail(job["id"], "worker", "panair run not successful")
+
+        assert queue.claim("worker") is None
+        assert queue.status(job_id) == ("failed", 2,
+                                        "panair run not successful")
+        with pytest.raises(RuntimeError):
+            queue.results(job_id)
+
+
+def test_jobqueue_concurrent_submit(tmpdir):
+    path = str(tmpdir.join("jobs.db"))
+    with JobQueue(path) as queue:
+        case = _case(str(tmpdir.join("case")), "panair", 1.)
+        job_ids = {}
+
+        def submit(i):
+            job_ids[i] = queue.submit(case, metadata={"i": i})
+
+        threads = [threading.Thread(target=submit, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(8):
+            job = queue.claim("worker")
+            assert job_ids[job["metadata"]["user"]["i"]] == job["id"]
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_jobqueue_heartbeat_error(tmpdir, monkeypatch):
+    exe = stub_panair.write_executable(str(tmpdir))
+    path = str(tmpdir.join("jobs.db"))
+    with JobQueue(path, lease_time=0.3, max_attempts=1) as queue:
+        job_id = queue.submit(_case(str(tmpdir.join("case")), exe, 1.))
+
+    def heartbeat(self, job_id, worker):
+        raise sqlite3.OperationalError("database is locked")
+
+    # Panair is stopped once the lease can't be renewed before it runs out
+    monkeypatch.setattr(JobQueue, "heartbeat", heartbeat)
+    monkeypatch.setenv("STUB_PANAIR_DELAY", "10")
+    start = time.monotonic()
+    run_worker(path, exe)
+    assert time.monotonic()-start < 5.
+
+    with JobQueue(path) as queue:
+        state, attempts, error = queue.status(job_id)
+    assert state == "failed"
+    assert "lease could not be renewed" in error
@@ -81,3 +81,132 @@ def test_cosinespacing():
                             0.66945927, 0.8, 0.90641778,  0.97587705, 1.])
 
     assert np.allclose(points, test_points, rtol=0., atol=1.e-7)
+
+
+def test_meshparameterspace_batch():
+    n_width = 3
+    eta_min = np.zeros((2, n_width, 2))
+    eta_min[:, :, 0] = np.linspace(0., 1., n_width)
+    eta_min[0, :, 1] = np.linspace(0.2, .4, n_width)
+    eta_min[1, :, 1] = np.linspace(0., .3, n_width)
+
+    mesh_x, mesh_y = mt.meshparameterspace(shape=(n_width, n_width),
+                                           eta_limits=(eta_min, None))
+
+    assert mesh_x.shape == mesh_y.shape == (2, n_width, n_width)
+    for k in range(2):
+        single_x, single_y = mt.meshparameterspace(
+            shape=(n_width, n_width), eta_limits=(eta_min[k], None))
+        assert np.array_equal(mesh_x[k], single_x)
+        assert np.array_equal(mesh_y[k], single_y)
+
+
+def test_meshcoons():
+    # boundaries of a bilinear patch are reproduced in the interior
+    corners = np.array([[[0., 0.], [0.3, 1.5]],
+                        [[2., 0.5], [2.5, 2.]]])
+    u = np.linspace(0., 1., 6)[:, None, None]
+    v = np.linspace(0., 1., 4)[None, :, None]
+    patch = ((1.-u)*(1.-v)*corners[0, 0]+(1.-u)*v*corners[0, 1] +
+             u*(1.-v)*corners[1, 0]+u*v*corners[1, 1])
+    boundaries = [np.stack([b, b+1.]) for b in
+                  (patch[0], patch[-1], patch[:, 0], patch[:, -1])]
+
+    grid = mt.mesh_coons(*boundaries)
+
+    assert grid.shape == (2, 6, 4, 2)
+    assert np.allclose(grid[0], patch, rtol=0., atol=1.e-14)
+    assert np.allclose(grid[1], patch+1., rtol=0., atol=1.e-14)
+
+
+def test_axisymmetricsurf():
+    data_x = np.linspace(0., 1., 450)
+    data_r = np.sin(data_x)
+    N_theta = 5
+
+    networks = mt.axisymmetric_surf(data_x, data_r, N_theta)
+
+    assert [n.shape for n in networks] == [(5, 151, 3), (5, 151, 3),
+                                           (5, 150, 3)]
+    assert np.array_equal(networks[0][:, -1], networks[1][:, 0])
+    theta = np.linspace(np.pi, np.pi/2., N_theta)
+    for i, t in enumerate(theta):
+        assert np.allclose(networks[2][i, :, 0], data_x[300:])
+        assert np.allclose(networks[2][i, :, 1], data_r[300:]*np.sin(t))
+        assert np.allclose(networks[2][i, :, 2], data_r[300:]*np.cos(t))
+
+
+def test_surfaceofrevolution_batch():
+    data_x = np.random.rand(4, 30)
+    data_r = np.random.rand(4, 30)
+    theta = np.array([0., 0.5, 1.])
+
+    batch = mt.surface_of_revolution(data_x, data_r, theta_spacing=theta,
+                                     max_axial=20)
+
+    assert len(batch) == 4
+    for k, networks in enumerate(batch):
+        single = mt.surface_of_revolution(data_x[k], data_r[k],
+                                          theta_spacing=theta, max_axial=20)
+        assert len(networks) == len(single) == 2
+        for n, s in zip(networks, single):
+            assert np.array_equal(n, s)
+
+
+def test_coarsenaxi():
+    data_x = np.linspace(0., 2., 41)
+    data_r = np.sin(np.pi*data_x/2.)**2
+
+    new_x, new_r = mt.coarsen_axi(data_x, data_r, 0.01, 0.5)
+
+    kept = [0, 2, 4, 6, 9, 13, 15, 17, 19, 21, 23, 25, 28, 33, 35, 37, 39, 40]
+    assert np.array_equal(new_x, data_x[kept])
+    assert np.array_equal(new_r, data_r[kept])
+
+
+def test_coarsenaxi_maxlength():
+    data_x = np.linspace(0., 1., 101)
+    data_r = np.full(101, 0.5)
+
+    new_x, new_r = mt.coarsen_axi(data_x, data_r, 0.01, 0.25)
+
+    assert np.allclose(new_x, [0., 0.25, 0.5, 0.75, 1.])
+    assert np.array_equal(new_r, np.full(5, 0.5))
+
+
+def test_coarsenaxi_large():
+    # segments spanning many points used to take quadratic time
+    data_x = np.linspace(0., 100., 200001)
+    data_r = np.full(200001, 0.5)
+
+    new_x, new_r = mt.coarsen_axi(data_x, data_r, 0.01, 10.)
+
+    assert np.allclose(new_x, np.linspace(0., 100., 11))
+
+
+def test_direction_sums():
+    vectors = np.random.randn(1000, 2)
+    chords = np.random.randn(50, 2)
+    sums = mt._DirectionSums()
+    for i in range(0, 1000, 100):
+        sums.add(vectors[i:i+100])
+
+    expected = np.abs(np.outer(chords[:, 0], vectors[:, 1]) -
+                      np.outer(chords[:, 1], vectors[:, 0])).sum(axis=1)
+    assert np.allclose(sums.abs_cross(chords), expected)
+
+
+def test_generatewakes():
+    te_points = [np.array([[1., 0., 0.], [1., 1., 0.]]),
+                 np.array([[2., 0., 1.], [2., .5, 1.], [2., 1., 1.]])]
+
+    wakes = mt.generate_wakes(te_points, [3., 4.], n_points=3,
+                              angle_of_attack=45.)
+
+    assert [w.shape for w in wakes] == [(3, 2, 3), (3, 3, 3)]
+    assert np.allclose(wakes[0][:, 1, 0], [1., 2., 3.])
+    assert np.allclose(wakes[0][:, 1, 1], 1.)
+    assert np.allclose(wakes[0][:, 1, 2], [0., 1., 2.])
+    assert np.allclose(wakes[1][-1, :, 0], 4.)
+    for wake, te, x_end in zip(wakes, te_points, [3., 4.]):
+        assert np.array_equal(wake, mt.generate_wake(te, x_end, 3, 45.))
@@ -1,9 +1,20 @@
 """ """
 import pytest
+import asyncio
 import os
 import platform
+import subprocess
+import sys
+import time
+import numpy as np
 
 import panairwrapper
+from panairwrapper.cache import ResultCache
+from panairwrapper.panairwrapper import (NetworkRegistry, _exit_code,
+                                         _run_sweep_case)
+from panairwrapper.progress import DEFAULT_ABORT_PATTERNS
+from panairwrapper.workspace import WorkspacePool
+import stub_panair
 
 TESTFILE_DIR = os.path.join(os.path.dirname(__file__), 'testfiles')
 
@@ -33,3 +44,394 @@ def test_generate_dir(empty_case):
     assert os.path.isfile(os.path.join(TESTFILE_DIR, "panair_files", PANAIR_EXE))
 
 
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_async_timeout(tmpdir):
+    exe = tmpdir.join("slow_panair")
+    exe.write("#!/bin/sh\nsleep 10\n")
+    exe.chmod(0o755)
+
+    case = panairwrapper.PanairWrapper("slow_case", str(tmpdir), exe=str(exe))
+    case.set_aero_state(mach=1.6)
+    case.add_network("surface", np.zeros((2, 2, 3)))
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(case.run_async(timeout=0.2))
+
+    # the process is killed and its workspace removed
+    assert not tmpdir.join("panair_files").check()
+
+
+def test_named_offbody_points(tmpdir):
+    case = panairwrapper.PanairWrapper("sensor_case", str(tmpdir))
+    case.add_offbody_points(np.zeros((3, 3)), name="near")
+    case.add_offbody_points(np.ones((2, 3)), name="far")
+    case.add_offbody_points(np.full((4, 3), 2.), name="near")
+
+    assert case._offbody_points.shape == (6, 3)
+    slices = case._offbody_slices()
+    assert np.array_equal(case._offbody_points[slices["far"]], np.ones((2, 3)))
+    assert np.array_equal(case._offbody_points[slices["near"]],
+                          np.full((4, 3), 2.))
+
+    # unnamed points replace all named sets
+    case.add_offbody_points(np.zeros((5, 3)))
+    assert len(case._offbody_points) == 5
+    assert not case._offbody_slices()
+
+    # and are kept when named sets are added after them
+    case.add_offbody_points(np.ones((2, 3)), name="far")
+    assert case._offbody_points.shape == (7, 3)
+    assert case._offbody_slices() == {"far": slice(5, 7)}
+
+
+def test_incremental_inputfile(tmpdir):
+    exe = tmpdir.join("panair")
+    exe.write("")
+    case = panairwrapper.PanairWrapper("incremental_case", str(tmpdir),
+                                       exe=str(exe))
+    case.set_aero_state(mach=1.6)
+    case.add_network("front", np.zeros((3, 2, 3)))
+    case.add_network("back", np.ones((3, 2, 3)))
+    case._generate_dir(True)
+    case._generate_inputfile()
+
+    filename = tmpdir.join("panair_files", "incremental_case.INP")
+    text = filename.read()
+    # only the location of the text is kept, not the text itself
+    assert case._render_cache[("network", "front")][1:] == (
+        text.index("=nm"), text.index("=nm", text.index("=nm")+1))
+
+    # a modified or truncated inputfile is written again in full
+    filename.write("edited")
+    case._generate_inputfile()
+    assert filename.read() == text
+    filename.write(text[:len(text)//2])
+    case.add_network("back", np.full((3, 2, 3), 2.))
+    case._generate_inputfile()
+    assert "2.00000000" in filename.read()
+
+    # the text of unchanged networks is copied from the previous inputfile
+    case.set_aero_state(mach=2.0)
+    case.add_network("back", np.full((3, 2, 3), 3.))
+    case._generate_inputfile()
+    fresh = panairwrapper.PanairWrapper("incremental_case",
+                                        str(tmpdir.join("fresh")),
+                                        exe=str(exe))
+    fresh.set_aero_state(mach=2.0)
+    fresh.add_network("front", np.zeros((3, 2, 3)))
+    fresh.add_network("back", np.full((3, 2, 3), 3.))
+    fresh._generate_dir(True)
+    fresh._generate_inputfile()
+    assert filename.read() == tmpdir.join(
+        "fresh", "panair_files", "incremental_case.INP").read()
+
+    # copies of a case keep their own record
+    copy = case._copy_case(str(tmpdir.join("copy")))
+    assert copy._render_cache is not case._render_cache
+
+
+def test_network_registry():
+    registry = NetworkRegistry()
+    registry.add("body", 1, network_type=1)
+    registry.add("wake", 2, network_type=18)
+    registry.add("wing", 3, network_type=1)
+    registry.add("tail", 4, network_type=18)
+
+    # replacing keeps the position but moves the network to its new type
+    registry.add("body", 5, network_type=18)
+    assert [n[0] for n in registry] == ["body", "wake", "wing", "tail"]
+    assert registry.names_of_type(1) == ["wing"]
+
+    groups = registry.grouped_by_type()
+    assert groups == [(18, [("body", 5), ("wake", 2), ("tail", 4)]),
+                      (1, [("wing", 3)])]
+
+    registry.remove("wing")
+    assert "wing" not in registry
+    assert registry.names_of_type(1) == []
+    assert len(registry) == 3
+    with pytest.raises(RuntimeError):
+        registry.remove("wing")
+
+
+def test_add_wake(tmpdir):
+    exe = tmpdir.join("panair")
+    exe.write("")
+    case = panairwrapper.PanairWrapper("wake_case", str(tmpdir), exe=str(exe))
+    case.set_aero_state(mach=1.6)
+    case.add_network("wing", np.zeros((3, 2, 3)))
+    case.add_network("tail", np.ones((3, 2, 3)))
+    case.add_wake("wing_wake", "wing", 3, 10.)
+    case.add_wake("tail_wake", "tail", 3, 10.)
+    case.add_wake("wing_wake_2", "wing", 1, 10., network_type=20)
+    case._generate_dir(True)
+    case._generate_inputfile()
+
+    text = tmpdir.join("panair_files", "wake_case.INP").read()
+    assert text.index("$POINTS") < text.index("$TRAILING matchw=0")
+    assert text.index("$TRAILING matchw=0") < text.index("$TRAILING kt=20")
+    block = text.split("$TRAILING matchw=0\n")[1].split("$")[0]
+    assert block.splitlines()[1].split() == ["2.0"]
+    assert block.count("wing_wake") == 1 and block.count("tail_wake") == 1
+
+    case.remove_wake("tail_wake")
+    case.add_wake("tail_wake", "fin", 3, 10.)
+    with pytest.raises(RuntimeError):
+        case._generate_inputfile()
+
+
+def test_lazy_imports():
+    # heavy optional subsystems are not loaded by importing the package
+    script = "import sys, panairwrapper; print(' '.join(sys.modules))"
+    root = os.path.join(os.path.dirname(__file__), "..")
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=root)
+    modules = output.decode().split()
+
+    assert "numpy" in modules
+    for name in ["panairwrapper.mesh_tools", "panairwrapper.plot", "asyncio",
+                 "multiprocessing", "concurrent.futures", "pyqtgraph",
+                 "pyevtk", "evtk"]:
+        assert name not in modules
+
+
+def _stub_case(tmpdir, title="stub_case"):
+    # case with two networks and off-body points run by the stub Panair
+    exe = stub_panair.write_executable(str(tmpdir))
+    case = panairwrapper.PanairWrapper(title, str(tmpdir), exe=exe)
+    case.set_aero_state(mach=1.6, alpha=2.)
+    case.add_network("front", np.random.rand(4, 3, 3))
+    case.add_network("back", np.random.rand(5, 3, 3))
+    case.add_offbody_points(np.random.rand(7, 3))
+
+    return case
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_stub(tmpdir):
+    case = _stub_case(tmpdir)
+    results = case.run()
+
+    assert results.check_successful()
+    assert results.get_forces_and_moments()["cl"] == pytest.approx(0.2)
+    offbody = results.get_offbody_data()
+    assert offbody.shape == (7, 11)
+    assert np.allclose(offbody[:, 8], 0.02)
+    agps = results._output_file.read_agps()
+    assert len(agps) == 4*3+5*3
+    assert np.allclose(agps['cp'], 0.02)
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_many_cases_stub(tmpdir):
+    case = _stub_case(tmpdir)
+    case.set_aero_state(mach=1.6, alpha=[float(i) for i in range(8)])
+    results = case.run()
+
+    assert [results.get_forces_and_moments(i)["cl"] for i in range(8)] == \
+        pytest.approx([0.1*i for i in range(8)])
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_sweep_stub(tmpdir):
+    case = _stub_case(tmpdir)
+    rows = case.sweep(mach=[1.4, 1.6], alpha=[0., 1., 2.], workers=2,
+                      cases_per_run=2)
+
+    assert [(r["mach"], r["alpha"]) for r in rows] == [
+        (1.4, 0.), (1.4, 1.), (1.4, 2.), (1.6, 0.), (1.6, 1.), (1.6, 2.)]
+    assert all(r["success"] for r in rows)
+    assert [r["cl"] for r in rows] == pytest.approx([0., .1, .2]*2)
+
+
+def test_sweep_case_error(tmpdir):
+    case = panairwrapper.PanairWrapper("missing_exe", str(tmpdir),
+                                       exe=str(tmpdir.join("missing")))
+    case.set_aero_state(mach=1.6, alpha=[0., 1.])
+    case.add_network("body", np.random.rand(4, 3, 3))
+
+    # errors other than failed runs are reported in the rows as well
+    rows = _run_sweep_case(case)
+    assert [r["success"] for r in rows] == [False, False]
+    assert all(r["error"].startswith("FileNotFoundError") for r in rows)
+    assert np.isnan(rows[0]["cl"])
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_sweep_workspace_pool_stub(tmpdir):
+    case = _stub_case(tmpdir)
+    with WorkspacePool(3, case._panair_exec,
+                       root=str(tmpdir.join("pool"))) as pool:
+        held = pool.acquire()
+        rows = case.sweep(alpha=[0., 1., 2., 3.], workspace_pool=pool)
+        assert all(r["success"] for r in rows)
+        assert [r["cl"] for r in rows] == pytest.approx([0., .1, .2, .3])
+        # only the free workspaces are used and they are released after
+        assert {r["directory"] for r in rows} <= set(pool._workspaces)-{held}
+        assert pool.acquire(0.) != held
+
+        # a sweep doesn't wait forever for a held workspace
+        pool.acquire(0.)
+        with pytest.raises(RuntimeError):
+            case.sweep(alpha=[0.], workspace_pool=pool,
+                       workspace_timeout=0.01)
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_cache_stub(tmpdir, monkeypatch):
+    cache = ResultCache(str(tmpdir.join("cache")))
+    case = _stub_case(tmpdir)
+    first = case.run(cache=cache)
+
+    # a cached result is returned without running Panair, which would fail
+    monkeypatch.setenv("STUB_PANAIR_ABORT", "1")
+    second = case.run(cache=cache)
+    assert (second.get_forces_and_moments() ==
+            first.get_forces_and_moments())
+    assert np.array_equal(second.get_offbody_data(), first.get_offbody_data())
+
+    case.set_aero_state(mach=1.6, alpha=3.)
+    with pytest.raises(RuntimeError):
+        case.run(cache=cache)
+
+    # the results of the case are those of the last run, also on a hit
+    monkeypatch.delenv("STUB_PANAIR_ABORT")
+    case.set_aero_state(mach=1.6, alpha=5.)
+    case.run(cache=cache)
+    case.set_aero_state(mach=1.6, alpha=2.)
+    for run in [lambda: case.run(cache=cache),
+                lambda: asyncio.run(case.run_async(cache=cache))]:
+        results = run()
+        assert results.run_record.cached
+        assert case._results is results
+        assert case._results.get_forces_and_moments()["cl"] == \
+            pytest.approx(0.2)
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_cache_error_stub(tmpdir, monkeypatch, caplog):
+    cache = ResultCache(str(tmpdir.join("cache")))
+    case = _stub_case(tmpdir)
+
+    def put(*args):
+        raise OSError(28, "No space left on device")
+
+    # results of a successful run are returned even if they can't be cached
+    monkeypatch.setattr(cache, "put", put)
+    results = case.run(cache=cache)
+    assert results.get_forces_and_moments()["cl"] == pytest.approx(0.2)
+    results = asyncio.run(case.run_async(cache=cache))
+    assert results.get_forces_and_moments()["cl"] == pytest.approx(0.2)
+    assert len([r for r in caplog.records
+                if "could not be cached" in r.getMessage()]) == 2
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_record_stub(tmpdir, monkeypatch):
+    case = _stub_case(tmpdir)
+    records = []
+    results = case.run(callback=records.append)
+
+    record = results.run_record
+    assert records == [record]
+    assert record.success and not record.cached
+    assert list(record.phases) == ["directory", "inputfile", "cache",
+                                   "panair"]
+    assert record.inputfile_size == os.path.getsize(
+        tmpdir.join("panair_files", "stub_case.INP"))
+    assert (record.n_networks, record.n_points, record.n_panels,
+            record.n_offbody_points, record.n_cases) == (2, 27, 14, 7, 1)
+    if hasattr(os, "wait4"):
+        assert record.cpu_user + record.cpu_system > 0.
+        assert record.max_rss > 0
+
+    # time spent reading results is added to the record
+    results.get_offbody_data()
+    parse_time = record.phases["parse"]
+    results.get_forces_and_moments()
+    assert record.phases["parse"] > parse_time
+    assert record.as_dict()["wall_time"] == pytest.approx(record.wall_time)
+
+    monkeypatch.setenv("STUB_PANAIR_ABORT", "1")
+    with pytest.raises(RuntimeError):
+        case.run(callback=records.append)
+    assert not records[-1].success
+    assert "panair" in records[-1].phases
+
+    # a failing callback doesn't hide the error of the run
+    def callback(record):
+        raise ValueError("callback failed")
+
+    with pytest.raises(RuntimeError, match="not successful"):
+        case.run(callback=callback)
+
+    # killed processes get the negative signal number, as with subprocess
+    assert (_exit_code(9), _exit_code(3 << 8)) == (-9, 3)
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_progress_stub(tmpdir, monkeypatch):
+    case = _stub_case(tmpdir)
+    events = []
+    case.run(progress=events.append)
+    assert [e.stage for e in events] == ["geometry", "off-body"]
+    assert events[0].elapsed <= events[1].elapsed
+
+    # without monitoring, a failed run is only noticed once it has exited
+    monkeypatch.setenv("STUB_PANAIR_ABORT", "1")
+    with pytest.raises(RuntimeError, match="not successful"):
+        case.run()
+
+    # a run reporting ABORT is killed without waiting for it to finish
+    monkeypatch.setenv("STUB_PANAIR_DELAY", "10")
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="aborted: ABORT"):
+        case.run(abort_patterns=DEFAULT_ABORT_PATTERNS)
+    assert time.monotonic()-start < 5.
+
+    # as is a run matching a pattern given by the user
+    monkeypatch.delenv("STUB_PANAIR_ABORT")
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="network back"):
+        case.run(abort_patterns=[r"network back"])
+    assert time.monotonic()-start < 5.
+
+    events = []
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="aborted"):
+        asyncio.run(case.run_async(progress=events.append,
+                                   abort_patterns=[r"network back"]))
+    assert time.monotonic()-start < 5.
+    assert [e.stage for e in events] == ["geometry"]
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_named_offbody_stub(tmpdir):
+    case = _stub_case(tmpdir)
+    near = np.random.rand(3, 3)
+    far = np.random.rand(4, 3)+5.
+    case.add_offbody_points(near, name="near")
+    case.add_offbody_points(far, name="far")
+    results = case.run()
+
+    assert results.get_offbody_data().shape == (14, 11)
+    assert np.allclose(results.get_offbody_data(name="near")[:, 2:5], near,
+                       atol=1e-4)
+    assert np.allclose(results.get_offbody_data(name="far")[:, 2:5], far,
+                       atol=1e-4)
+    with pytest.raises(KeyError):
+        results.get_offbody_data(name="mid")
+
+    # results read without the sets of the case have no named rows
+    with pytest.raises(KeyError):
+        panairwrapper.panairwrapper.Results(
+            results._directory).get_offbody_data(name="near")
@@ -0,0 +1,22 @@
+import numpy as np
+import panairwrapper.plot as plot
+
+
+def test_faces():
+    faces = plot._faces(3, 4)
+
+    assert faces.shape == (12, 3)
+    assert np.array_equal(faces[:2], [[0, 4, 5], [5, 1, 0]])
+    assert np.array_equal(faces[-2:], [[6, 10, 11], [11, 7, 6]])
+
+
+def test_decimation():
+    rows, cols = plot._decimation(1000, 50, max_points=5000)
+
+    assert len(rows)*len(cols) < 1000*50
+    assert rows[0] == cols[0] == 0
+    assert rows[-1] == 999 and cols[-1] == 49
+
+    rows, cols = plot._decimation(10, 5, max_points=5000)
+    assert np.array_equal(rows, np.arange(10))
+    assert np.array_equal(cols, np.arange(5))
@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import platform
+import pytest
+
+import panairwrapper
+import panairwrapper.panairwrapper as pw
+from panairwrapper.panairwrapper import RunRecord
+from panairwrapper.scheduler import CostModel, run_batch, schedule
+import stub_panair
+
+
+def _case(directory, exe, n_points, n_offbody=0):
+    case = panairwrapper.PanairWrapper("batch_case", directory, exe=exe)
+    case.set_aero_state(mach=1.6, alpha=1.)
+    case.add_network("body", np.random.rand(n_points, n_points, 3))
+    if n_offbody:
+        case.add_offbody_points(np.random.rand(n_offbody, 3))
+
+    return case
+
+
+_run_sweep_case = pw._run_sweep_case
+
+
+def _crashing_run(case, *args):
+    # kills the worker process for alpha 1 and raises for alpha 2
+    alpha = case._aero_state[1]
+    if alpha == 1.:
+        os._exit(1)
+    if alpha == 2.:
+        raise MemoryError("out of memory")
+    return _run_sweep_case(case, *args)
+
+
+def test_costmodel_predict(tmpdir):
+    model = CostModel()
+    small = _case(str(tmpdir.join("small")), "panair", 5)
+    large = _case(str(tmpdir.join("large")), "panair", 20)
+    offbody = _case(str(tmpdir.join("offbody")), "panair", 5, 1000)
+
+    assert CostModel.case_size(large) == (19*19, 0, 1)
+    assert model.predict(large)[0] > model.predict(small)[0]
+    assert model.predict(large)[1] > model.predict(small)[1]
+    assert model.predict(offbody)[0] > model.predict(small)[0]
+
+
+def test_costmodel_observe():
+    model = CostModel()
+    for n_panels in [100, 200, 400, 800, 1600, 3200, 6400, 12800, 25600,
+                     51200]:
+        record = RunRecord("case", ".")
+        record.n_panels = n_panels
+        record.n_cases = 1
+        record.phases["panair"] = 1e-9*n_panels**3
+        record.max_rss = 1000+n_panels
+        model.observe(record.as_dict())
+
+    # cached runs are ignored
+    record.cached = True
+    record.phases["panair"] = 0.
+    model.observe(record)
+
+    case = panairwrapper.PanairWrapper("case")
+    case.set_aero_state()
+    case.add_network("body", np.zeros((101, 101, 3)))
+    run_time, memory = model.predict(case)
+    assert run_time == pytest.approx(1e-9*10000**3, rel=1e-2)
+    assert memory == pytest.approx(1024*(1000+10000), rel=1e-2)
+
+
+def test_schedule():
+    # longest runs first
+    started = schedule([1., 5., 3., 2.], [1., 1., 1., 1.], workers=2)
+    assert [s[0] for s in started] == [1, 2, 3, 0]
+    assert [s[1] for s in started] == [0., 0., 3., 5.]
+
+    # the memory budget keeps the two large runs apart
+    started = schedule([5., 4., 1., 1.], [3., 3., 1., 1.], workers=2,
+                       memory_budget=4.)
+    assert [s[0] for s in started] == [0, 2, 3, 1]
+
+
+@pytest.mark.skipif(platform.system() == 'Windows',
+                    reason="requires a shell script executable")
+def test_run_batch_stub(tmpdir):
+    exe = stub_panair.write_executable(str(tmpdir))
+    sizes = [3, 8, 5]
+    cases = [_case(str(tmpdir.join("case_"+str(i))), exe, n)
+             for i, n in enumerate(sizes)]
+    model = CostModel()
+
+    results = run_batch(cases, workers=2, cost_model=model)
+
+    assert len(results) == 3
+    for rows, n in zip(results, sizes):
+        assert rows[0]['success']
+        assert rows[0]['run_record']['n_points'] == n*n
+    assert len(model._observations) == 3
+
+
+@pytest.mark.skipif(platform.system() != 'Linux',
+                    reason="patches the worker processes through fork")
+def test_run_batch_worker_errors(tmpdir, monkeypatch):
+    exe = stub_panair.write_executable(str(tmpdir))
+    cases = []
+    for i, alpha in enumerate([0., 1., 2., 3.]):
+        case = _case(str(tmpdir.join("case_"+str(i))), exe, 3)
+        case.set_aero_state(mach=1.6, alpha=alpha)
+        cases.append(case)
+    monkeypatch.setattr(pw, "_run_sweep_case", _crashing_run)
+
+    # a dead worker or an error in a run only fails the rows of that run
+    results = run_batch(cases, workers=1)
+    assert [rows[0]['success'] for rows in results] == [True, False, False,
+                                                        True]
+    assert "BrokenProcessPool" in results[1][0]['error']
+    assert results[2][0]['error'] == "MemoryError: out of memory"
+    assert results[3][0]['cl'] == pytest.approx(0.3)
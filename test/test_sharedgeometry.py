@@ -0,0 +1,64 @@
+import os
+import pickle
+import numpy as np
+
+import panairwrapper
+import panairwrapper.sharedgeometry as sg
+from panairwrapper.sharedgeometry import SharedGeometry, restore
+
+
+def test_shared_geometry(tmpdir):
+    case = panairwrapper.PanairWrapper("shared_case", str(tmpdir))
+    case.set_aero_state(mach=1.6, alpha=[0., 2.])
+    case.add_network("body", np.random.rand(100, 50, 3))
+    case.add_network("wake", np.random.rand(3, 50, 3), network_type=18)
+    case.add_offbody_points(np.random.rand(10, 3), name="near")
+    case.add_offbody_points(np.random.rand(5, 3), name="far")
+
+    with SharedGeometry(case) as geometry:
+        stripped = geometry.strip(case)
+        # the geometry isn't pickled with the case
+        assert len(pickle.dumps(stripped)) < 10000
+        restored = restore(pickle.loads(pickle.dumps(stripped)))
+
+        assert ([(n, t) for n, d, t in restored._networks] ==
+                [(n, t) for n, d, t in case._networks])
+        for (n, data, t), (m, shared, u) in zip(case._networks,
+                                                restored._networks):
+            assert np.array_equal(data, shared)
+            assert not shared.flags.writeable
+        assert np.array_equal(restored._offbody_points, case._offbody_points)
+        assert restored._offbody_slices() == case._offbody_slices()
+        assert restored._case_angles() == case._case_angles()
+        path = geometry.manifest['path']
+        assert os.path.exists(path)
+
+    assert not os.path.exists(path)
+
+    # cases that weren't stripped are returned as they are
+    assert restore(case) is case
+
+
+def test_shared_geometry_eviction(tmpdir, monkeypatch):
+    case = panairwrapper.PanairWrapper("shared_case", str(tmpdir))
+    case.add_network("body", np.random.rand(4, 3, 3))
+    monkeypatch.setattr(sg, "_mapped", sg.OrderedDict())
+    monkeypatch.setattr(sg, "_MAX_MAPPED", 2)
+
+    geometries = [SharedGeometry(case) for i in range(3)]
+    paths = [g.manifest['path'] for g in geometries]
+    for geometry in geometries:
+        restore(geometry.strip(case))
+    # only the most recently used maps are kept
+    assert list(sg._mapped) == paths[1:]
+
+    # maps are dropped once their file is removed, also by another process
+    geometries[2].close()
+    assert list(sg._mapped) == paths[1:2]
+    os.remove(paths[1])
+    restore(geometries[0].strip(case))
+    assert list(sg._mapped) == paths[:1]
+
+    for geometry in geometries:
+        geometry.close()
+    assert not sg._mapped
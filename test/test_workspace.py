@@ -0,0 +1,49 @@
+"""Tests the workspace pool."""
+import os
+import pytest
+import panairwrapper.workspace as ws
+
+
+@pytest.fixture
+def exe(tmpdir):
+    exe = tmpdir.join("panair")
+    exe.write("#!/bin/sh\n")
+    return str(exe)
+
+
+def test_link_executable(tmpdir, exe):
+    directory = tmpdir.mkdir("case")
+
+    target = ws.link_executable(exe, str(directory))
+    assert os.path.isfile(target)
+    assert os.path.samefile(target, exe)
+
+    # an existing link is left in place
+    inode = os.lstat(target).st_ino
+    ws.link_executable(exe, str(directory))
+    assert os.lstat(target).st_ino == inode
+
+
+def test_workspace_pool(tmpdir, exe):
+    pool = ws.WorkspacePool(2, exe, root=str(tmpdir.join("pool")))
+    assert len(pool) == 2
+
+    with pool.workspace() as first:
+        with open(os.path.join(first, "rwms01"), 'w') as f:
+            f.write("scratch")
+        second = pool.acquire()
+        assert second != first
+        with pytest.raises(RuntimeError):
+            pool.acquire(timeout=0.01)
+        pool.release(second)
+
+    # released workspaces only hold the executable
+    assert os.listdir(first) == ["panair"]
+
+
+def test_workspace_pool_temporary_root(exe):
+    with ws.WorkspacePool(1, exe) as pool:
+        workspace = pool.acquire()
+        assert os.path.isdir(workspace)
+
+    assert not os.path.exists(workspace)